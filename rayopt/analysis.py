@@ -19,14 +19,18 @@
 from __future__ import (absolute_import, print_function,
                         unicode_literals, division)
 
+import itertools
+import pickle
+
 import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 from matplotlib import gridspec
 
-from . import GeometricTrace, GaussianTrace
+from . import GeometricTrace, GaussianTrace, FFTWorkspace
+from .geometric_trace import psf_mtf, mtf_slices
 from .utils import tanarcsin
-from .special_sums import polar_sum
+from .special_sums import polar_binning
 
 
 class CenteredFormatter(mpl.ticker.ScalarFormatter):
@@ -40,6 +44,122 @@ class CenteredFormatter(mpl.ticker.ScalarFormatter):
         return super(CenteredFormatter, self).__call__(value, pos)
 
 
+# The trace work of the plots below is done by module level functions
+# `f(system, items, *args)` that return one result per item (field height
+# or wavelength). They only return arrays and can be evaluated in worker
+# processes that each hold an unpickled copy of the system.
+
+_worker_system = None
+
+
+def _worker_init(system):
+    global _worker_system
+    _worker_system = pickle.loads(system)
+
+
+def _worker_call(fun, *args):
+    return fun(_worker_system, *args)
+
+
+def transverse_fans(system, heights, wavelengths, nrays):
+    """Entrance pupil and image plane coordinates of the tee ray fans
+    relative to the chief ray, for each height and wavelength."""
+    p = system.object.pupil.distance
+    t = GeometricTrace(system)
+    t.rays_batch([(0, hi) for hi in heights], wavelengths,
+                 nrays=nrays, distribution="tee", clip=True)
+    fans = []
+    for t in t.split():
+        y = t.y[-1, :, :2] - t.y[-1, t.ref, :2]
+        py = t.y[0, :, :2] + p*tanarcsin(t.u[0])
+        py -= py[t.ref]
+        fans.append((py, y, t.ref))
+    n = len(wavelengths)
+    return [fans[i*n:(i + 1)*n] for i in range(len(heights))]
+
+
+def spot_diagrams(system, heights, wavelengths, nrays):
+    """Image plane intercepts relative to the chief ray and slopes of
+    the hexapolar spots, for each height and wavelength."""
+    t = GeometricTrace(system)
+    t.rays_batch([(0, hi) for hi in heights], wavelengths,
+                 nrays=nrays, distribution="hexapolar", clip=True)
+    spots = []
+    for t in t.split():
+        y = t.y[-1, :, :2] - t.y[-1, t.ref, :2]
+        u = tanarcsin(t.i[-1])
+        spots.append((y, u))
+    n = len(wavelengths)
+    return [spots[i*n:(i + 1)*n] for i in range(len(heights))]
+
+
+def opd_psfs(system, heights, wavelength, nrays):
+    """OPD and centered PSF for each height, None if no ray made it
+    through."""
+    t = GeometricTrace(system)
+    ws = FFTWorkspace()
+    n = int(np.sqrt(nrays*4/np.pi))
+    r = []
+    for hi in heights:
+        t.rays_grid((0, hi), wavelength, n=n, clip=True)
+        try:
+            x, y, o = t.opd()
+        except ValueError:
+            r.append(None)
+            continue
+        p, q, psf = map(np.fft.fftshift, t.psf(workspace=ws))
+        r.append((x, y, o, p, q, psf))
+    return r
+
+
+def mtf_curves(system, heights, wavelength, frequencies, defocus, n):
+    """Sagittal and tangential MTF at `frequencies` for each height,
+    in focus and through the image plane shifts `defocus`."""
+    t = GeometricTrace(system)
+    ms, mt = t.mtf_fields(heights, frequencies, wavelength, n=n,
+                          defocus=np.r_[0, defocus])
+    return list(zip(ms, mt))
+
+
+def longitudinal_curves(system, wavelengths, height, nrays):
+    """Image plane chief, meridional and sagittal intercepts and slopes
+    along the field line to `height` and the longitudinal spherical
+    aberration, for each wavelength."""
+    r = []
+    for wi in wavelengths:
+        t = GeometricTrace(system)
+        t.rays_line((0, height), wi, nrays=nrays)
+        abc = np.split(t.y[-1].T, (nrays, 2*nrays), axis=1)
+        pqr = np.split(tanarcsin(t.i[-1]).T, (nrays, 2*nrays), axis=1)
+        t = GeometricTrace(system)
+        t.rays_point((0, 0.), wi, nrays=nrays,
+                     distribution="half-meridional", clip=True)
+        p = system.object.pupil.distance
+        py = t.y[0, :, 1] + p*tanarcsin(t.u[0])[:, 1]
+        u = tanarcsin(t.i[-1])[:, 1]
+        u[t.ref] = np.nan
+        z = -t.y[-1, :, 1]/u
+        r.append((abc, pqr, py, z))
+    return r
+
+
+def axial_color(system, wavelengths, nrays):
+    """Paraxial focus shift relative to `wavelengths[0]` over a
+    wavelength range slightly wider than `wavelengths`."""
+    wl, wu = min(wavelengths), max(wavelengths)
+    ww = np.linspace(wl - (wu - wl)/4, wu + (wu - wl)/4, nrays)
+    zc = []
+    pd, ph = system.pupil((0, 0), wavelengths[0])
+    t = GeometricTrace(system)
+    for wwi in np.r_[wavelengths[0], ww]:
+        y, u = system.aim((0, 0), (0, 1e-3), pd, ph)
+        t.rays_given(y, u, wwi)
+        t.propagate(clip=False)
+        zc.append(-t.y[-1, 0, 1]/tanarcsin(t.i[-1, 0])[1])
+    zc = np.array(zc[1:]) - zc[0]
+    return ww, zc
+
+
 class Analysis(object):
     figwidth = 12.
     run = True
@@ -61,6 +181,9 @@ class Analysis(object):
     defocus = 5
     plot_opds = True
     plot_longitudinal = True
+    plot_mtf = False
+    workers = 0
+    _executor = None
 
     def __init__(self, system, **kwargs):
         self.system = system
@@ -93,6 +216,39 @@ class Analysis(object):
             t.rays_point((0, 0.), nrays=13, distribution="radau",
                          clip=False, filter=False)
             t.refocus()
+        if self.workers:
+            self.start_workers(self.workers)
+        try:
+            return self.assemble()
+        finally:
+            self.stop_workers()
+
+    def start_workers(self, workers=None):
+        """Start a pool of `workers` processes (None for one per CPU)
+        that do the trace work of the plots. Each worker receives a
+        pickled copy of the system once. Changes to the system made after
+        this are not seen by the workers."""
+        from concurrent.futures import ProcessPoolExecutor
+        self.stop_workers()
+        self._executor = ProcessPoolExecutor(
+            workers, initializer=_worker_init,
+            initargs=(pickle.dumps(self.system),))
+
+    def stop_workers(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def map(self, fun, items, *args):
+        """Evaluate `fun(system, items, *args)`, one item per task if
+        there are workers."""
+        if self._executor is None:
+            return fun(self.system, items, *args)
+        futures = [self._executor.submit(_worker_call, fun, [i], *args)
+                   for i in items]
+        return [r for f in futures for r in f.result()]
+
+    def assemble(self):
         if self.print_system:
             self.text.append(str(self.system))
         if self.print_paraxial:
@@ -144,6 +300,12 @@ class Analysis(object):
             self.figures.append(fig)
             self.opds(ax[::-1], self.system.fields)
 
+        if self.plot_mtf:
+            fig, ax = plt.subplots(
+                1, 2, figsize=(self.figwidth, self.figwidth/3))
+            self.figures.append(fig)
+            self.mtfs(ax, self.system.fields)
+
         return self.text, self.figures
 
     @staticmethod
@@ -226,26 +388,21 @@ class Analysis(object):
         if wavelengths is None:
             wavelengths = self.system.wavelengths
         ax = self.pre_setup_fanplot(fig, len(heights))
-        p = self.system.object.pupil.distance
-        for hi, axi in zip(heights, ax):
+        fans = self.map(transverse_fans, heights, wavelengths, nrays_line)
+        for hi, axi, fi in zip(heights, ax, fans):
             axm, axsm, axss = axi
             axm.text(-.1, .5, "OY=%s" % hi, rotation="vertical",
                      transform=axm.transAxes,
                      verticalalignment="center")
-            for wi, ci in zip(wavelengths, colors):
-                t = GeometricTrace(self.system)
-                t.rays_point((0, hi), wi, nrays=nrays_line,
-                             distribution="tee", clip=True)
+            for wi, ci, (py, y, ref) in zip(
+                    wavelengths, itertools.cycle(colors), fi):
                 # plot transverse image plane versus entrance pupil
                 # coordinates
-                y = t.y[-1, :, :2] - t.y[-1, t.ref, :2]
-                py = t.y[0, :, :2] + p*tanarcsin(t.u[0])
-                py -= py[t.ref]
-                axm.plot(py[:t.ref, 1], y[:t.ref, 1], "-%s" % ci,
+                axm.plot(py[:ref, 1], y[:ref, 1], "-%s" % ci,
                          label="%s" % wi)
-                axsm.plot(py[t.ref:, 0], y[t.ref:, 1], "-%s" % ci,
+                axsm.plot(py[ref:, 0], y[ref:, 1], "-%s" % ci,
                           label="%s" % wi)
-                axss.plot(py[t.ref:, 0], y[t.ref:, 0], "-%s" % ci,
+                axss.plot(py[ref:, 0], y[ref:, 0], "-%s" % ci,
                           label="%s" % wi)
         for axi in ax:
             for axii in axi:
@@ -267,15 +424,12 @@ class Analysis(object):
         for zi, axi in zip(z, ax[-1, :]):
             axi.text(.5, -.1, "DZ=%.1g" % zi,
                      transform=axi.transAxes, horizontalalignment="center")
-        for hi, axi in zip(heights, ax):
-            for wi, ci in zip(wavelengths, colors):
+        spots = self.map(spot_diagrams, heights, wavelengths, nrays)
+        for axi, si in zip(ax, spots):
+            for wi, ci, (y, u) in zip(wavelengths, itertools.cycle(colors),
+                                      si):
                 r = paraxial.airy_radius[1]/paraxial.wavelength*wi
-                t = GeometricTrace(self.system)
-                t.rays_point((0, hi), wi, nrays=nrays,
-                             distribution="hexapolar", clip=True)
                 # plot transverse image plane hit pattern (ray spot)
-                y = t.y[-1, :, :2] - t.y[-1, t.ref, :2]
-                u = tanarcsin(t.i[-1])
                 for axij, zi in zip(axi, z):
                     axij.add_patch(mpl.patches.Circle(
                         (0, 0), r, edgecolor=ci, facecolor="none"))
@@ -296,20 +450,17 @@ class Analysis(object):
         for hi, axi in zip(heights, ax[:, 0]):
             axi.text(-.1, .5, "OY=%s" % hi, rotation="vertical",
                      transform=axi.transAxes, verticalalignment="center")
-        for hi, axi in reversed(list(zip(heights, ax))):
+        opds = self.map(opd_psfs, heights, wavelength, nrays)
+        for axi, oi in reversed(list(zip(ax, opds))):
             axo, axp, axe, axm = axi
             # TODO: link axes
             self.pre_setup_xyplot(axo)
             self.pre_setup_xyplot(axp)
             self.setup_axes(axe, "R", "E")
             self.setup_axes(axm, "F", "C")
-            t = GeometricTrace(self.system)
-            t.rays_point((0, hi), wavelength, nrays=nrays,
-                         distribution="hexapolar", clip=True)
-            try:
-                x, y, o = t.opd()
-            except ValueError:
+            if oi is None:
                 continue
+            x, y, o, p, q, psf = oi
             og = o[np.isfinite(o)]
             if mm is None:
                 mm = np.fabs(og).max()
@@ -320,20 +471,23 @@ class Analysis(object):
             r = paraxial.airy_radius[1]/paraxial.wavelength*wavelength
             axp.add_patch(mpl.patches.Circle(
                 (0, 0), r, edgecolor="green", facecolor="none"))
-            x, y, psf = map(np.fft.fftshift, t.psf())
-            x0 = (psf*x).sum()
-            y0 = (psf*y).sum()
-            x, y = x - x0, y - y0
-            dx = x[1, 0] - x[0, 0]
+            x0 = (psf*p).sum()
+            y0 = (psf*q).sum()
+            x, y = p - x0, q - y0
+            dx, dy = x[1, 0] - x[0, 0], y[0, 1] - y[0, 0]
             psfl = np.log10(psf)
             levels = psfl.max() - 1 - np.arange(4)
             levels = levels[::-1]
             axp.contour(x, y, psfl, levels, cmap=plt.cm.Reds, alpha=.2)
             levels = np.linspace(0, psf.max(), 21)
             axp.contour(x, y, psf, levels, cmap=plt.cm.Greys)
-            ee = polar_sum(psf, (psf.shape[0]/2 + x0/dx,
-                                 psf.shape[1]/2 + y0/dx), "azimuthal")
-            ee = np.cumsum(ee)
+            # round the centroid to pixels so that the binning is
+            # reused between runs, radii are in units of dx
+            ee = polar_binning(psf.shape, (
+                int(round(psf.shape[0]/2 + x0/dx)),
+                int(round(psf.shape[1]/2 + y0/dy))),
+                aspect=dy/dx, binsize=1.)
+            ee = ee.cumsum(psf)
             if rm is None:
                 rm = np.searchsorted(ee, .9)*1.5*dx
             axp.set_xlim(-rm, rm)
@@ -343,18 +497,43 @@ class Analysis(object):
             axe.set_xlim(0, rm)
             axe.set_ylim(0, 1)
             axe.set_aspect("auto")
-            for i, ci in enumerate(("-", "--")):
-                ot = np.fft.ifft(np.fft.ifftshift(psf.sum(i))*psf.size**.5)
-                of = np.fft.fftfreq(ot.size, dx)
-                ot, of = ot[:ot.size//2], of[:of.size//2]
-                axm.plot(of, np.absolute(ot), "k"+ci)
-                # axm.plot(of, ot.real, "k"+ci)
-            axm.set_xlim(0, 1/r)
+            fs, ms, ft, mt = mtf_slices(*psf_mtf(psf, dx, dy))
+            axm.plot(fs, ms, "k--")
+            axm.plot(ft, mt, "k-")
+            axm.set_xlim(0, 1.22/r)
             axm.set_ylim(0, 1)
         for axi in ax:
             for axij in axi:
                 self.post_setup_axes(axij)
 
+    def mtfs(self, ax, heights=[0., .707, 1.], wavelength=None,
+             frequencies=[.1, .2, .4], nz=21, n=32, colors="grbcmyk"):
+        """MTF versus field height and through focus (at the first
+        height) at `frequencies` (in units of the cutoff frequency) for
+        sagittal (dashed) and tangential (solid) orientation."""
+        paraxial = self.system.paraxial
+        if wavelength is None:
+            wavelength = self.system.wavelengths[0]
+        axh, axz = ax
+        r = paraxial.airy_radius[1]/paraxial.wavelength*wavelength
+        f = np.array(frequencies)*1.22/r
+        z = paraxial.rayleigh_range[1]/paraxial.wavelength*wavelength
+        z = np.linspace(-2*z, 2*z, nz)
+        self.setup_axes(axh, "H", "M", yzero=False)
+        self.setup_axes(axz, "DZ", "M", yzero=False)
+        m = self.map(mtf_curves, heights, wavelength, f, z, n)
+        ms, mt = (np.array(mi) for mi in zip(*m))
+        for i, ci in zip(range(len(f)), itertools.cycle(colors)):
+            axh.plot(heights, ms[:, 0, i], "--" + ci)
+            axh.plot(heights, mt[:, 0, i], "-" + ci,
+                     label="%.3g" % f[i])
+            axz.plot(z, ms[0, 1:, i], "--" + ci)
+            axz.plot(z, mt[0, 1:, i], "-" + ci, label="%.3g" % f[i])
+        for axi in ax:
+            axi.set_ylim(0, 1)
+            axi.set_aspect("auto")
+            self.post_setup_axes(axi)
+
     def longitudinal(self, ax, height=1.,
                      wavelengths=None, nrays=21, colors="grbcmyk"):
         # lateral color: image relative to image at wl[0]
@@ -373,11 +552,10 @@ class Analysis(object):
             self.setup_axes(axi, xl, yl, tl, yzero=False, xzero=False)
         h = np.linspace(0, height*self.system.image.radius, nrays)
         h[0] = np.nan
-        for i, (wi, ci) in enumerate(zip(wavelengths, colors)):
-            t = GeometricTrace(self.system)
-            t.rays_line((0, height), wi, nrays=nrays)
-            a, b, c = np.split(t.y[-1].T, (nrays, 2*nrays), axis=1)
-            p, q, r = np.split(tanarcsin(t.i[-1]).T, (nrays, 2*nrays), axis=1)
+        curves = self.map(longitudinal_curves, wavelengths, height, nrays)
+        for i, (wi, ci, cu) in enumerate(zip(
+                wavelengths, itertools.cycle(colors), curves)):
+            (a, b, c), (p, q, r), py, z = cu
             if i == 0:
                 xd = (a[1] - h)/h
                 xd[0] = np.nan
@@ -389,26 +567,8 @@ class Analysis(object):
             axf.plot(a[1], xt, ci+"-", label="EZt %s" % wi)
             xs = -(c[0]-a[0])/(r[0]-p[0])
             axf.plot(a[1], xs, ci+"--", label="EZs %s" % wi)
-            t = GeometricTrace(self.system)
-            t.rays_point((0, 0.), wi, nrays=nrays,
-                         distribution="half-meridional", clip=True)
-            p = self.system.object.pupil.distance
-            py = t.y[0, :, 1] + p*tanarcsin(t.u[0])[:, 1]
-            u = tanarcsin(t.i[-1])[:, 1]
-            u[t.ref] = np.nan
-            z = -t.y[-1, :, 1]/u
             axs.plot(py, z, ci+"-", label="%s" % wi)
-        wl, wu = min(wavelengths), max(wavelengths)
-        ww = np.linspace(wl - (wu - wl)/4, wu + (wu - wl)/4, nrays)
-        zc = []
-        pd, ph = self.system.pupil((0, 0), wavelengths[0])
-        t = GeometricTrace(self.system)
-        for wwi in np.r_[wavelengths[0], ww]:
-            y, u = self.system.aim((0, 0), (0, 1e-3), pd, ph)
-            t.rays_given(y, u, wwi)
-            t.propagate(clip=False)
-            zc.append(-t.y[-1, 0, 1]/tanarcsin(t.i[-1, 0])[1])
-        zc = np.array(zc[1:]) - zc[0]
+        ww, zc = axial_color(self.system, wavelengths, nrays)
         axa.plot(ww, zc, "-")
         for axi in ax:
             self.post_setup_axes(axi)
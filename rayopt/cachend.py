@@ -28,16 +28,30 @@ from .utils import public
 
 @public
 class CacheND(object):
-    def __init__(self, solver, guess=None, **kwargs):
+    def __init__(self, solver, guess=None, key=None, **kwargs):
         self.solver = solver
         self.interpolator = None
         self.kwargs = kwargs
         self.cache = {}
+        self.guesses = {}
+        self.key = key
         self.clear(guess)
 
     def clear(self, guess=None):
         self.cache.clear()
-        self.guess = None
+        self.guesses.clear()
+        self.interpolator = None
+        self.guess = guess
+
+    def rekey(self, key):
+        """Mark the cached values as stale if `key` differs from
+        the key they were computed under. Stale values are not returned
+        but used as initial guesses for the solver."""
+        if key == self.key:
+            return
+        self.guesses.update(self.cache)
+        self.cache.clear()
+        self.key = key
 
     def __call__(self, *args):
         try:
@@ -45,11 +59,20 @@ class CacheND(object):
         except KeyError:
             pass
         guess = self.guess
-        if self.interpolator:
+        stale = args in self.guesses
+        if stale:
+            guess = self.guesses.pop(args)
+        elif self.interpolator:
             guess = self.interpolator(*args)
             if np.any(np.isnan(guess)):
                 guess = self.guess
-        value = self.solver(*args, guess=guess, **self.kwargs)
+        try:
+            value = self.solver(*args, guess=guess, **self.kwargs)
+        except (ValueError, AssertionError, RuntimeError):
+            if not stale:
+                raise
+            # stale guess too far off, start over
+            value = self.solver(*args, guess=self.guess, **self.kwargs)
         self.cache[args] = value
         self._update()
         return value
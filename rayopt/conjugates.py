@@ -90,6 +90,8 @@ class Conjugate(NameMixin):
         a pupil aperture (also for infinite object or telecentric pupils,
         then from z=0)
 
+        z and a can also be given per ray (shapes (n,) and (n, 2, 2))
+
         if z, a are not provided they are takes from the (paraxial data) stored
         in object/pupil
         """
@@ -141,32 +143,37 @@ class FiniteConjugate(Conjugate):
     def aim(self, yo, yp=None, z=None, a=None, surface=None, filter=True):
         if z is None:
             z = self.pupil.distance
+        z = np.asarray(z)
         yo = np.atleast_2d(yo)
         if yp is not None:
             if a is None:
                 a = self.pupil.radius
                 a = np.array(((-a, -a), (a, a)))
-            a = np.arctan2(a, z)
+            a = np.asarray(a)
+            if a.ndim < 2:
+                a = np.arctan2(a, z)
+            else:
+                a = np.arctan2(a, z[..., None, None])
             yp = np.atleast_2d(yp)
             yp = self.pupil.map(yp, a, filter)
-            yp = z*np.tan(yp)
+            yp = z[..., None]*np.tan(yp)
             yo, yp = np.broadcast_arrays(yo, yp)
 
         y = np.zeros((yo.shape[0], 3))
         y[..., :2] = -yo*self.radius
         if surface is not None:
             y[..., 2] = -surface.surface_sag(y)
-        uz = (0, 0, z)
+        uz = np.zeros(z.shape + (3,))
+        uz[..., 2] = z
         if self.pupil.telecentric:
-            u = uz
+            u = np.broadcast_to(uz, y.shape).copy()
         else:
             u = uz - y
         if yp is not None:
             s, m = sagittal_meridional(u, uz)
             u += yp[..., 0, None]*s + yp[..., 1, None]*m
         normalize(u)
-        if z < 0:
-            u *= -1
+        u *= np.where(z < 0, -1, 1)[..., None]
         return y, u
 
 
@@ -249,9 +256,11 @@ class InfiniteConjugate(Conjugate):
             yp = np.atleast_2d(yp)
             yp = self.pupil.map(yp, a, filter)
             yo, yp = np.broadcast_arrays(yo, yp)
+        z = np.asarray(z)
         u = self.map(yo, self.angle)
-        yz = (0, 0, z)
-        y = yz - z*u
+        yz = np.zeros(z.shape + (3,))
+        yz[..., 2] = z
+        y = yz - z[..., None]*u
         if yp is not None:
             s, m = sagittal_meridional(u, yz)
             y += yp[..., 0, None]*s + yp[..., 1, None]*m
@@ -20,17 +20,22 @@ from __future__ import (absolute_import, print_function,
                         unicode_literals, division)
 
 import numpy as np
-from scipy.optimize import newton
 
 from .utils import public
 from .transformations import (euler_matrix, euler_from_matrix,
                               rotation_matrix)
 from .name_mixin import NameMixin
+from .stamp_mixin import StampMixin
 from .material import Material
 
+try:
+    from .trace_accel import spheroid_propagate
+except ImportError:
+    spheroid_propagate = None
+
 
 @public
-class TransformMixin(object):
+class TransformMixin(StampMixin):
     def __init__(self, distance=0., direction=(0, 0, 1.), angles=(0, 0, 0),
                  offset=None):
         self.update(distance, direction, angles)
@@ -175,6 +180,26 @@ class TransformMixin(object):
     def to_normal(self, *y):
         return self._do_rotate(self.rot_normal, True, self.rotated, y)
 
+    def _do_rotate_into(self, rotation, inverse, flag, y, out):
+        if not flag:
+            out[...] = y
+            return out
+        if inverse:
+            rotation = rotation.T
+        return np.dot(y, rotation, out=out)
+
+    def from_normal_into(self, y, out):
+        """from_normal(y) written into out (must not share memory with
+        y)"""
+        return self._do_rotate_into(self.rot_normal, False, self.rotated,
+                                    y, out)
+
+    def to_normal_into(self, y, out):
+        """to_normal(y) written into out (must not share memory with
+        y)"""
+        return self._do_rotate_into(self.rot_normal, True, self.rotated,
+                                    y, out)
+
 
 @public
 class Element(NameMixin, TransformMixin):
@@ -228,13 +253,37 @@ class Element(NameMixin, TransformMixin):
         m[0, 2] = m[1, 3] = d/n0
         return n0, m
 
-    def propagate(self, y0, u0, n0, l, clip=True):
-        t = self.intercept(y0, u0)
-        y = y0 + t[:, None]*u0
+    def propagate(self, y0, u0, n0, l, clip=True, out=None):
+        # out: optional (y, u, t) arrays to be filled, y may be y0
+        if out is None:
+            out = (np.empty_like(y0), np.empty_like(u0),
+                   np.empty(y0.shape[:1]))
+        y, u, t = out
+        t[:] = self.intercept(y0, u0)
+        y[:] = y0
+        y += t[:, None]*u0
         if clip:
             u0 = self.clip(y, u0)
-        n = n0
-        return y, u0, n, t*n0
+        u[:] = u0
+        t *= n0
+        return y, u, n0, t
+
+    def propagate_jacobian(self, y, i, s, n0, l, dy0, di, dn0, dp):
+        """Derivatives of the intercepts `y`, excidence directions and
+        optical path lengths (and the refractive index after the element)
+        along m directions in parameter space, given the incidence
+        directions `i`, the geometric path lengths `s` and the index `n0`
+        before the element.
+
+        `dy0`, `di` (m, nrays, 3) are the derivatives of the ray origins
+        and incidence directions in normal coordinates, `dn0` (m,) those
+        of `n0`. `dp` (m, 3) are the derivatives of the curvature, conic
+        and refractive index of this element.
+        """
+        ds = -(dy0[..., 2] + s*di[..., 2])/i[:, 2]
+        dy = dy0 + ds[..., None]*i + s[:, None]*di
+        dt = ds*n0 + s*dn0[:, None]
+        return dy, di, dt, dn0
 
     def transfer_poly(self, state):
         fd = (-state.f).shift(self.offset[2])
@@ -281,6 +330,12 @@ class Interface(Element):
             material = Material.make(material)
         self.material = material
 
+    @property
+    def stamp(self):
+        if self.material is None:
+            return self._stamp
+        return max(self._stamp, self.material.stamp)
+
     def get_n_mu(self, n0, l):
         if self.material is None:
             return n0, 1.
@@ -296,6 +351,11 @@ class Interface(Element):
         return dat
 
     def refractive_index(self, wavelength):
+        if np.ndim(wavelength):
+            # per-ray wavelengths: look up each distinct one once
+            l, i = np.unique(wavelength, return_inverse=True)
+            n = self.material.refractive_indices(l)
+            return n[i].reshape(np.shape(wavelength))
         return self.material.refractive_index(wavelength)
 
     def paraxial_matrix(self, n0, l):
@@ -304,16 +364,55 @@ class Interface(Element):
             n = self.refractive_index(l)
         return n, m
 
-    def propagate(self, y0, u0, n0, l, clip=True):
-        t = self.intercept(y0, u0)
-        y = y0 + t[:, None]*u0
-        if clip:
-            u0 = self.clip(y, u0)
-        u = u0
+    def propagate(self, y0, u0, n0, l, clip=True, out=None):
+        y, u, n, t = super(Interface, self).propagate(y0, u0, n0, l, clip,
+                                                      out)
         n, mu = self.get_n_mu(n0, l)
-        if mu:
-            u = self.refract(y, u0, mu)
-        return y, u, n, t*n0
+        if np.any(mu):
+            u[:] = self.refract(y, u, mu)
+        return y, u, n, t
+
+    def propagate_jacobian(self, y, i, s, n0, l, dy0, di, dn0, dp):
+        q = self.surface_normal(y)
+        fc, fk = self.sag_jacobian(y)
+        # implicit derivative of the intercept condition sag(y) == 0
+        ds = -((q*(dy0 + s[:, None]*di)).sum(-1) +
+               dp[:, 0, None]*fc + dp[:, 1, None]*fk)/(q*i).sum(-1)
+        dy = dy0 + ds[..., None]*i + s[:, None]*di
+        dt = ds*n0 + s*dn0[:, None]
+        if self.material is None:
+            return dy, di, dt, dn0
+        n, mu = self.get_n_mu(n0, l)
+        mu = mu*np.ones(y.shape[0])
+        if self.material.mirror:
+            dn, dmu = dn0, np.zeros_like(dt)
+        else:
+            dn = dp[:, 2]
+            dmu = (dn0[:, None] - mu*dn[:, None])/n
+        # derivative of the surface normal
+        e, er, ec, ek = self.normal_jacobian(y)
+        de = (2*er*(y[:, :2]*dy[..., :2]).sum(-1) +
+              ec*dp[:, 0, None] + ek*dp[:, 1, None])
+        dq = np.zeros_like(dy)
+        dq[..., :2] = dy[..., :2]*e[:, None] + y[:, :2]*de[..., None]
+        # derivative of the refraction in refract()
+        r2 = np.square(q).sum(1)
+        dr2 = 2*(q*dq).sum(-1)
+        muf, dmuf = np.fabs(mu), np.sign(mu)*dmu
+        iq = (i*q).sum(1)
+        a = muf*iq/r2
+        da = (dmuf*iq + muf*((di*q).sum(-1) + (i*dq).sum(-1)) - a*dr2)/r2
+        if np.all(mu == -1):
+            du = di - 2*(da[..., None]*q + a[:, None]*dq)
+        else:
+            b = (np.square(mu) - 1)/r2
+            w = np.sqrt(np.square(a) - b)
+            g = -a + np.sign(mu)*w
+            db = (2*mu*dmu - b*dr2)/r2
+            dg = -da + np.sign(mu)*(a*da - db/2)/w
+            du = (dmuf[..., None]*i + muf[:, None]*di +
+                  dg[..., None]*q + g[:, None]*dq)
+        return dy, du, dt, dn
 
     def dispersion(self, lmin, lmax):
         if self.material is None:
@@ -326,27 +425,52 @@ class Interface(Element):
     def surface_normal(self, p):
         raise NotImplementedError
 
+    def sag_jacobian(self, p):
+        raise NotImplementedError
+
+    def normal_jacobian(self, p):
+        raise NotImplementedError
+
     def edge_sag(self, axis=1):
         r = np.zeros(3)
         r[axis] = self.radius
         return self.surface_sag(r)
 
-    def intercept(self, y, u):
-        s = super(Interface, self).intercept(y, u)
-        for i in range(y.shape[0]):
-            yi, ui = y[None, i], u[None, i]
-
-            def func(si):
-                return self.surface_sag(yi + si*ui)[0]
-
-            def fprime(si):
-                return np.dot(self.surface_normal(yi + si*ui), ui.T)[0]
-
-            try:
-                s[i] = newton(func=func, fprime=fprime, x0=s[i],
-                              tol=1e-7, maxiter=5)
-            except RuntimeError:
-                s[i] = np.nan
+    def intercept(self, y, u, tol=1e-7, maxiter=5, s=None, maxstep=None,
+                  full_output=False):
+        """Newton-Raphson on all rays at once, starting from the
+        intercepts `s` (default: the plane intercept). Steps are
+        bounded by `maxstep`. Rays that do not converge within
+        `maxiter` are nan.
+
+        If `full_output`, also returns the number of iterations per ray
+        (-1 if not converged)."""
+        if s is None:
+            s = super(Interface, self).intercept(y, u)
+        s = np.array(s, dtype=np.float64)
+        n = np.zeros(s.shape, int)
+        active = np.flatnonzero(np.isfinite(s))
+        s[~np.isfinite(s)] = np.nan
+        for i in range(maxiter):
+            if not active.size:
+                break
+            ya, ua, sa = y[active], u[active], s[active]
+            p = ya + sa[:, None]*ua
+            f = self.surface_sag(p)
+            fp = (self.surface_normal(p)*ua).sum(1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ds = np.where(f == 0, 0., f/fp)
+            if maxstep is not None:
+                ds = np.clip(ds, -maxstep, maxstep)
+            s[active] = sa - ds
+            n[active] = i + 1
+            bad = ~np.isfinite(ds)
+            s[active[bad]] = np.nan
+            active = active[~bad & (np.fabs(ds) >= tol) & (f != 0)]
+        s[active] = np.nan
+        if full_output:
+            n[~np.isfinite(s)] = -1
+            return s, n
         return s
 
     def refract(self, y, u0, mu):
@@ -354,19 +478,20 @@ class Interface(Element):
         # General Ray-Tracing Procedure
         # JOSA, Vol. 52, Issue 6, pp. 672-676 (1962)
         # doi:10.1364/JOSA.52.000672
-        if mu == 1:
+        # mu can be a scalar or per ray
+        if np.all(mu == 1):
             return u0
         r = self.surface_normal(y)
         r2 = np.square(r).sum(1)
-        muf = abs(mu)
+        muf = np.fabs(mu)
         a = muf*(u0*r).sum(1)/r2
         # solve g**2 + 2*a*g + b=0
-        if mu == -1:
+        if np.all(mu == -1):
             u = u0 - 2*a[:, None]*r  # reflection
         else:
-            b = (mu**2 - 1)/r2
+            b = (np.square(mu) - 1)/r2
             g = -a + np.sign(mu)*np.sqrt(np.square(a) - b)
-            u = muf*u0 + g[:, None]*r  # refraction
+            u = np.asarray(muf)[..., None]*u0 + g[:, None]*r  # refraction
         return u
 
     def surface_cut(self, axis, points):
@@ -475,10 +600,35 @@ class Spheroid(Interface):
         q[..., :2] = xy*e[..., None]
         return q
 
-    def intercept(self, y, u):
+    def sag_jacobian(self, xyz):
+        """Derivatives of `surface_sag()` with respect to curvature and
+        conic"""
+        xy = xyz[..., :2]
+        r2 = np.einsum("...i,...i", xy, xy)
+        c, k = self.curvature, self.conic
+        s = np.sqrt(1 - (1 + k)*c**2*r2)
+        return -r2/(s*(1 + s)), -c**3*r2**2/(2*s*(1 + s)**2)
+
+    def normal_jacobian(self, xyz):
+        """Transverse factor `e` of the `surface_normal()` (x*e, y*e, 1)
+        and its derivatives with respect to r**2, curvature and conic"""
+        xy = xyz[..., :2]
+        r2 = np.einsum("...i,...i", xy, xy)
+        c, k = self.curvature, self.conic
+        s = np.sqrt(1 - (1 + k)*c**2*r2)
+        e = -c/s
+        er = -(1 + k)*c**3/(2*s**3)
+        ec = -1/s**3
+        ek = -c**3*r2/(2*s**3)
         if self.aspherics is not None:
-            return Interface.intercept(self, y, u)  # expensive iterative
-        # replace the newton-raphson with the analytic solution
+            for i, ai in enumerate(self.aspherics):
+                e = e - 2*(i + 1)*ai*r2**i
+                if i:
+                    er = er - 2*i*(i + 1)*ai*r2**(i - 1)
+        return e, er, ec, ek
+
+    def conic_intercept(self, y, u):
+        """Analytic intercept with the conic (without aspherics)"""
         c, k = self.curvature, self.conic
         if c == 0:
             return -y[:, 2]/u[:, 2]  # flat
@@ -498,9 +648,49 @@ class Spheroid(Interface):
         if self.alternate_intersection:
             g *= -1
         # g *= np.sign(u[:, 2])
-        s = -(d + g)/e
+        # s = -(d + g)/e, in the form without cancellation
+        # (and finite for e == 0, e.g. axial rays on a paraboloid)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            s = np.where(d*g < 0, f/(g - d), -(d + g)/e)
         return s
 
+    def intercept(self, y, u, tol=1e-7, maxiter=5, full_output=False):
+        """Intercept with the surface. Aspheres are solved by bounded
+        Newton-Raphson starting from the conic intercept, see
+        `Interface.intercept()`."""
+        s = self.conic_intercept(y, u)
+        if self.aspherics is None:
+            if full_output:
+                return s, np.where(np.isfinite(s), 0, -1)
+            return s
+        # conic misses: start from the plane
+        s = np.where(np.isfinite(s), s, -y[:, 2]/u[:, 2])
+        maxstep = self.radius if np.isfinite(self.radius) else None
+        return super(Spheroid, self).intercept(
+            y, u, tol, maxiter, s, maxstep, full_output)
+
+    def propagate(self, y0, u0, n0, l, clip=True, out=None):
+        if out is None:
+            out = (np.empty_like(y0), np.empty_like(u0),
+                   np.empty(y0.shape[:1]))
+        y, u, t = out
+        if spheroid_propagate is None or not all(
+                a.dtype == np.float64 and a.flags.c_contiguous
+                for a in out):
+            return super(Spheroid, self).propagate(y0, u0, n0, l, clip, out)
+        # compiled intercept, clip, refract and path length in one pass
+        n, mu = self.get_n_mu(n0, l)
+        m = y.shape[0]
+        y[:] = y0
+        u[:] = u0
+        a = np.array(self.aspherics or [], dtype=np.float64)
+        spheroid_propagate(
+            y, u, t, np.broadcast_to(np.asarray(n0, np.float64), (m,)),
+            np.broadcast_to(np.asarray(mu, np.float64), (m,)),
+            self.curvature, self.conic, a, self.alternate_intersection,
+            self.radius, clip)
+        return y, u, n, t
+
     def paraxial_matrix(self, n0, l):
         # Reflection and Refraction of Gaussian Light Beams at
         # Tilted Ellipsoidal Surfaces
@@ -554,15 +744,29 @@ class Spheroid(Interface):
             self.aspherics = [ai/scale**(2*i + 1) for i, ai in
                               enumerate(self.aspherics)]
 
-    def aberration(self, y, u0, u, n0, n, v0, v):
+    def paraxial_curvature(self):
+        """Paraxial curvature and fourth order sag coefficient including
+        the conic and the aspherics"""
         c = self.curvature
         k = self.conic*c**3/8
         if self.aspherics:
-            a2, a4 = self.aspherics[:2]
+            a2, a4 = (list(self.aspherics) + [0., 0.])[:2]
             k += a4 - a2/4*(4*a2**2 + 6*c*a2 + 3*c**2)
             c = c + 2*a2
+        return c, k
+
+    def aberration(self, y, u0, u, n0, n, v0, v):
+        c, k = self.paraxial_curvature()
         if self.material and self.material.mirror:
             n = -n
+        return self.seidel(c, k, y, u0, u, n0, n, v0, v)
+
+    @staticmethod
+    def seidel(c, k, y, u0, u, n0, n, v0, v):
+        """Third order aberration coefficients of a surface with
+        paraxial curvature `c` and fourth order coefficient `k`.
+        Broadcasts over trailing axes of `y, u0, u` (marginal, chief,
+        ...) and the other arguments."""
         mu = n0/n
         # incidence
         i = c*y + u0/n0
@@ -27,6 +27,8 @@ from scipy.interpolate import griddata
 from .elements import Spheroid
 from .utils import sinarctan, tanarcsin, public, pupil_distribution
 from .raytrace import Trace
+from .zernike import (ZernikeFit, zernike_fit, half_distributions,
+                      chief_distributions)
 
 
 @public
@@ -36,27 +38,72 @@ class GeometricTrace(Trace):
     i[i]: incoming/incidence direction before surface
     u[i]: outgoing/excidence direction after surface
     all in i-surface normal coordinates relative to vertex
+    n[i]: refractive index after surface, per ray if the rays
+    have different wavelengths
+
+    Storage policy: if `surfaces` is given, only the rows of those
+    elements (and always of the object, the last surface and the
+    image) are kept, `rows[j]` is the row of element `j` (or -1). The
+    optical path lengths of dropped elements are added to the next
+    kept row. `dtype` is the type of y, u, i and t (the trace is
+    computed in float64). `callback(j, y, u, i, n, t)` receives the
+    rows of every element as it is traced. `jacobian()`, `resize()`,
+    `plot()` and `print_trace()` need all rows stored.
     """
-    def allocate(self, nrays):
+    def __init__(self, system, surfaces=None, dtype=np.float64,
+                 callback=None):
+        super(GeometricTrace, self).__init__(system)
+        self.surfaces = surfaces
+        self.dtype = dtype
+        self.callback = callback
+
+    def allocate(self, nrays, batch=False):
         super(GeometricTrace, self).allocate()
         self.nrays = nrays
-        self.n = np.empty(self.length)
-        self.y = np.empty((self.length, nrays, 3))
+        self.rows = np.arange(self.length)
+        if self.surfaces is not None:
+            keep = set(j % self.length for j in self.surfaces)
+            keep = sorted(keep | set((0, self.length - 2,
+                                      self.length - 1)))
+            self.rows[:] = -1
+            self.rows[keep] = np.arange(len(keep))
+        m = self.rows.max() + 1
+        if batch:
+            self.n = np.empty((m, nrays))
+        else:
+            self.n = np.empty(m)
+        self.batch = None
+        self.grid = None
+        self.pupil_points = self.sampling = None
+        self.stamps = None
+        self.y = np.empty((m, nrays, 3), self.dtype)
         self.u = np.empty_like(self.y)
         self.i = np.empty_like(self.y)
         self.w = None
         self.ref = None
         self.l = 1.
-        self.t = np.empty((self.length, nrays))
+        self.t = np.empty((m, nrays), self.dtype)
+
+    @property
+    def full(self):
+        """Whether all rows are stored"""
+        return self.y.shape[0] == self.length
 
     def rays_given(self, y, u, l=None, w=None, ref=0):
         y, u = np.atleast_2d(y, u)
         y, u = np.broadcast_arrays(y, u)
         n, m = y.shape
-        if not hasattr(self, "y") or self.y.shape[1] != n:
-            self.allocate(n)
         if l is None:
             l = self.system.wavelengths[0]
+        batch = np.ndim(l) > 0
+        if (not hasattr(self, "y") or self.y.shape[1] != n or
+                self.n.ndim != batch + 1 or
+                self.y.shape[0] != self.rows.max() + 1 or
+                self.rows.shape[0] != len(self.system)):
+            self.allocate(n, batch)
+        self.batch = None
+        self.grid = None
+        self.pupil_points = self.sampling = None
         if w is None:
             w = np.ones(n)/n
         self.w = w
@@ -74,13 +121,60 @@ class GeometricTrace(Trace):
 
     def propagate(self, start=1, stop=None, clip=False):
         super(GeometricTrace, self).propagate()
-        init = start - 1
-        y, u, n, l = self.y[init], self.u[init], self.n[init], self.l
-        y, u = self.system[init].from_normal(y, u)
-        for j, yunit in enumerate(self.system.propagate(
-                y, u, n, l, start, stop, clip)):
-            j += start
-            self.y[j], self.u[j], self.n[j], self.i[j], self.t[j] = yunit
+        rows = None if self.full else self.rows
+        self.system.propagate_into(self.y, self.u, self.n, self.i, self.t,
+                                   self.l, start, stop, clip, rows,
+                                   self.callback)
+        self.clip = clip
+        if stop is None:
+            self.stamps = self.system.stamps()
+        else:
+            self.stamps = None
+
+    def update(self):
+        """Propagate again after changes to the system, starting at the
+        first changed element and keeping the rows before it."""
+        start = self.system.first_change(self.stamps)
+        if start is not None:
+            start = max(start, 1)
+            while self.rows[start - 1] < 0:
+                start -= 1
+            self.propagate(start, clip=self.clip)
+
+    def jacobian(self, params):
+        """Derivatives of the intercepts `y`, excidence directions `u`
+        and optical path lengths `t` with respect to the parameters
+        `params`, a list of `(element index, name)` with name one of
+        "curvature", "conic", "distance" or "n" (refractive index after
+        the element).
+
+        The input rays are kept fixed (no re-aiming), pickups and
+        solves are not taken into account.
+
+        Returns dy, du (len(params), length, nrays, 3) and
+        dt (len(params), length, nrays).
+        """
+        if not self.full:
+            raise ValueError("jacobian() needs all rows stored")
+        params = [(j % len(self.system), k) for j, k in params]
+        m = len(params)
+        dy = np.zeros((m,) + self.y.shape)
+        du = np.zeros_like(dy)
+        dt = np.zeros((m,) + self.t.shape)
+        dn = np.zeros(m)
+        for j in range(1, self.length):
+            e0, e = self.system[j - 1], self.system[j]
+            dp = np.array([[p == (j, k) for k in ("curvature", "conic", "n")]
+                           for p in params], dtype=np.float64)
+            dd = np.array([p == (j, "distance") for p in params],
+                          dtype=np.float64)
+            dy0 = e0.from_normal(dy[:, j - 1]) - dd[:, None, None]*e.direction
+            dy0, di = e.to_normal(dy0, e0.from_normal(du[:, j - 1]))
+            s = self.t[j]/self.n[j - 1]
+            dy[:, j], du[:, j], dt[:, j], dn = e.propagate_jacobian(
+                self.y[j], self.i[j], s, self.n[j - 1], self.l,
+                dy0, di, dn, dp)
+        return dy, du, dt
 
     def refocus(self, at=-1):
         y = self.y[at, :, :2]
@@ -133,7 +227,22 @@ class GeometricTrace(Trace):
         py[:, 2] -= radius
         py -= py[self.ref]
         x, y, z = py.T
-        if resample:
+        if self.grid is not None:
+            # rays_grid(): regular in the entrance pupil, map the grid
+            # linearly to the exit pupil
+            n = self.grid
+            g = np.linspace(-1, 1, n)
+            t = np.where(self.w[1:] > 0, t[1:], np.nan).reshape(n, n)
+            x, y = x[1:].reshape(n, n), y[1:].reshape(n, n)
+            good = np.isfinite(t) & np.isfinite(x) & np.isfinite(y)
+            if not np.any(good):
+                raise ValueError("no rays made it through")
+            gx, gy = np.broadcast_arrays(g[:, None], g)
+            gx, gy = gx[good], gy[good]
+            hx = np.dot(x[good], gx)/np.dot(gx, gx)
+            hy = np.dot(y[good], gy)/np.dot(gy, gy)
+            x, y = np.broadcast_arrays(g[:, None]*hx, g*hy)
+        elif resample:
             pyt = np.vstack((x, y, t))
             x, y, t = pyt[:, np.all(np.isfinite(pyt), axis=0)]
             if not t.size:
@@ -146,31 +255,287 @@ class GeometricTrace(Trace):
             x, y, t = xs, ys, ts
         return x, y, t
 
-    def psf(self, pad=4, resample=4, **kwargs):
+    def zernike(self, nterms=15, **kwargs):
+        """Zernike coefficients (Noll, in waves) of the OPD over the
+        normalized entrance pupil coordinates of the traced rays.
+
+        For the pupil samplings of `rays_point()` the cached
+        `zernike_fit()` is used if all rays made it through. Otherwise
+        the fit is done on the remaining rays. Returns the coefficients
+        and the RMS fit residual.
+        """
+        if self.pupil_points is None:
+            raise ValueError("no pupil coordinates, use rays_point()")
+        x, y, o = self.opd(resample=False, **kwargs)
+        xy, w = self.pupil_points, self.w
+        if self.grid is not None:
+            xy, w, o = xy[1:], w[1:], o.ravel()
+        good = np.isfinite(o) & (w > 0)
+        if not np.any(good):
+            raise ValueError("no rays made it through")
+        z = None
+        if (self.sampling is not None and self.sampling[0] != "random"
+                and np.all(np.isfinite(o))):
+            z = zernike_fit(*self.sampling, nterms=nterms)
+            if z.xy.shape[0] != o.size:
+                z = None  # rays were filtered
+        if z is None:
+            d = self.sampling and self.sampling[0]
+            if d in chief_distributions:
+                good[self.ref] = False
+            mirror = d in half_distributions
+            z = ZernikeFit(xy[good], nterms, w[good], mirror)
+            o = o[good]
+        c = z.fit(o)
+        return c, z.residual(o, c)
+
+    def psf(self, pad=4, resample=4, workspace=None, window=None,
+            n=None, center=(0., 0.), block=256, **kwargs):
+        """Point spread function, normalized to unit energy.
+
+        For a gridded OPD (`resample` or `rays_grid()`) without `window`
+        this is the FFT of the pupil function zero-padded `pad` times
+        and p, q are in FFT order.
+
+        Otherwise the weighted pupil samples are summed directly
+        (Huygens, as matrix products over `block` rays at a time) onto
+        an `n` by `n` grid (default `pad` times the pupil samples across)
+        around `center` with half width `window` (default: the FFT
+        field). This zooms onto any image plane region at any resolution
+        and honors non-uniform ray weights (e.g. quadrature
+        distributions). p, q are then increasing.
+        """
         radius = self.system[-1].distance
         x, y, o = self.opd(resample=resample, radius=radius,
                            **kwargs)
-        good = np.isfinite(o)
-        n = np.count_nonzero(good)
-        o = np.where(good, np.exp(-2j*np.pi*o), 0)/n**.5
-        if resample:
-            # NOTE: resample assumes constant amplitude in exit pupil
+        k = 1/(self.l/self.system.scale)
+        if o.ndim == 2 and window is None:
+            o = self.pupil_function(x, y, o, radius)
+            if workspace is None:
+                workspace = FFTWorkspace()
             nx, ny = (i*pad for i in o.shape)
-            apsf = np.fft.fft2(o, (nx, ny))
-            psf = (apsf*apsf.conj()).real/apsf.size
-            dx = x[1, 0] - x[0, 0]
-            k = 1/(self.l/self.system.scale)
-            f = np.fft.fftfreq(nx, dx*k/radius)
-            p, q = np.broadcast_arrays(f[:, None], f)
+            psf = workspace.psf(o, (nx, ny))
+            dx, dy = x[1, 0] - x[0, 0], y[0, 1] - y[0, 0]
+            p = np.fft.fftfreq(nx, dx*k/radius)
+            q = np.fft.fftfreq(ny, dy*k/radius)
+            p, q = np.broadcast_arrays(p[:, None], q)
+            return p, q, psf
+        if o.ndim == 1:
+            w = self.w
+        elif self.grid is not None:
+            w = self.w[1:]
         else:
-            raise NotImplementedError
-            n = self.y.shape[1]**.5
-            radius/2*np.pi*self.l/self.system.scale
-            r = int(3*x.max())
-            p, q = np.mgrid[-1:1:1j*n, -1:1:1j*n]*r
-            np.einsum("->", o, x, y)
+            w = np.ones(o.size)
+        x, y, o = x.ravel(), y.ravel(), o.ravel()
+        good = np.isfinite(x) & np.isfinite(y) & np.isfinite(o) & (w > 0)
+        if not np.any(good):
+            raise ValueError("no rays made it through")
+        x, y, o, w = x[good], y[good], o[good], w[good]
+        w = w/w.sum()
+        c = w*np.exp(-2j*np.pi*o)
+        k /= radius
+        # exit pupil area, exact for uniformly filled ellipses
+        area = 4*np.pi*np.sqrt(np.linalg.det(np.cov(
+            (x, y), aweights=w, bias=True)))
+        m = np.sqrt(x.size*4/np.pi)
+        if n is None:
+            n = int(pad*m)
+        if window is None:
+            window = m/(4*k*np.sqrt(area/np.pi))
+        dp = 2*window/n
+        p = center[0] + (np.arange(n) - n//2)*dp
+        q = center[1] + (np.arange(n) - n//2)*dp
+        a = np.zeros((n, n), np.complex128)
+        for i in range(0, x.size, block):
+            j = slice(i, i + block)
+            ax = np.exp(-2j*np.pi*k*p[:, None]*x[j])*c[j]
+            ay = np.exp(-2j*np.pi*k*y[j, None]*q)
+            a += np.dot(ax, ay)
+        psf = (np.square(a.real) + np.square(a.imag))*area*(k*dp)**2
+        p, q = np.broadcast_arrays(p[:, None], q)
+        return p, q, psf
+
+    def pupil_function(self, x, y, o, radius, defocus=None):
+        """Complex pupil function of the gridded OPD `x, y, o` on the
+        reference sphere of `radius`, normalized to unit energy.
+
+        If `defocus` (image plane shifts, scalar or array) is given, the
+        focus phase of the shifted reference sphere is added to the OPD
+        and the pupil functions are stacked along the first axis. This
+        evaluates through focus without retracing.
+        """
+        good = np.isfinite(o)
+        o = np.where(good, o, 0)
+        if defocus is not None:
+            n = self.n[-2]
+            if n.ndim:
+                n = n[self.ref]
+            c = np.sqrt(1 - (np.square(x) + np.square(y))/radius**2)
+            o = o + np.multiply.outer(
+                np.asarray(defocus)*n*self.system.scale/self.l, 1 - c)
+        m = np.count_nonzero(good)
+        # NOTE: gridded pupils assume constant amplitude in exit pupil
+        return np.where(good, np.exp(-2j*np.pi*o), 0)/m**.5
+
+    def mtf(self, defocus=None, pad=4, resample=4, workspace=None,
+            **kwargs):
+        """Modulation transfer function from the FFT of the `psf()` of
+        the gridded OPD (`resample` or `rays_grid()`).
+
+        `defocus` are image plane shifts applied to the traced OPD (see
+        `pupil_function()`), the MTFs are then stacked along the first
+        axis. Returns the frequencies fp, fq and the MTF as
+        `psf_mtf()`. Use `mtf_slices()` for the sagittal and tangential
+        curves.
+        """
+        radius = self.system[-1].distance
+        x, y, o = self.opd(resample=resample, radius=radius, **kwargs)
+        if o.ndim != 2:
+            raise ValueError("need a gridded OPD")
+        o = self.pupil_function(x, y, o, radius, defocus)
+        if workspace is None:
+            workspace = FFTWorkspace()
+        nx, ny = (i*pad for i in o.shape[-2:])
+        psf = workspace.psf(o, (nx, ny))
+        k = self.system.scale/self.l/radius
+        dx, dy = x[1, 0] - x[0, 0], y[0, 1] - y[0, 0]
+        return psf_mtf(psf, 1/(nx*dx*k), 1/(ny*dy*k), workspace)
+
+    def mtf_polychromatic(self, yo, wavelengths=None, weights=None,
+                          **kwargs):
+        """Polychromatic MTF at field `yo` from `psf_polychromatic()`,
+        returns fp, fq, mtf as `psf_mtf()`."""
+        p, q, psf = self.psf_polychromatic(yo, wavelengths, weights,
+                                           **kwargs)
+        return psf_mtf(psf, p[1, 0] - p[0, 0], q[0, 1] - q[0, 0])
+
+    def mtf_fields(self, heights, frequencies, wavelength=None, n=32,
+                   defocus=None, pad=4, workspace=None, stop=None,
+                   clip=True):
+        """Sagittal and tangential MTF at `frequencies` for each field
+        height in `heights` (and each image plane shift in `defocus`).
+
+        Each field is traced with `rays_grid()` and the pupil functions
+        of all fields and focus positions are transformed in one batch.
+        Returns the sagittal and tangential MTFs of shape (heights,
+        [defocus,] frequencies), nan where no ray made it through.
+        """
+        radius = self.system[-1].distance
+        if wavelength is None:
+            wavelength = self.system.wavelengths[0]
+        pupils, scales = [], []
+        for hi in heights:
+            self.rays_grid((0, hi), wavelength, n=n, stop=stop, clip=clip)
+            try:
+                x, y, o = self.opd(radius=radius)
+            except ValueError:
+                pupils.append(None)
+                scales.append(None)
+                continue
+            pupils.append(self.pupil_function(x, y, o, radius, defocus))
+            scales.append((x[1, 0] - x[0, 0], y[0, 1] - y[0, 0]))
+        if workspace is None:
+            workspace = FFTWorkspace()
+        shape = np.shape(defocus) + (len(frequencies),)
+        ms, mt = np.full((2, len(heights)) + shape, np.nan)
+        good = [i for i, o in enumerate(pupils) if o is not None]
+        if not good:
+            return ms, mt
+        psf = workspace.psf(np.array([pupils[i] for i in good]),
+                            (n*pad, n*pad))
+        m = np.abs(workspace.otf(psf))
+        m /= m[..., :1, :1]
+        k = self.system.scale/wavelength/radius
+        for i, mi in zip(good, m):
+            dx, dy = scales[i]
+            fs, fms, ft, fmt = mtf_slices(
+                np.fft.fftfreq(n*pad, 1/(n*pad*dx*k)),
+                np.fft.rfftfreq(n*pad, 1/(n*pad*dy*k)), mi)
+            for j in np.ndindex(shape[:-1]):
+                ms[(i,) + j] = np.interp(frequencies, fs, fms[j],
+                                         right=0)
+                mt[(i,) + j] = np.interp(frequencies, ft, fmt[j],
+                                         right=0)
+        return ms, mt
+
+    def psf_polychromatic(self, yo, wavelengths=None, weights=None,
+                          nrays=1000, distribution="square", pad=4,
+                          resample=4, n=None, dp=None, **kwargs):
+        """Polychromatic point spread function at field `yo`.
+
+        All `wavelengths` (default: the system spectrum) are traced in
+        one batch, their pupil functions are transformed onto a common
+        image plane grid of `n` by `n` points spaced `dp` (default: the
+        `psf()` grid of the shortest wavelength) by a stacked matrix
+        Fourier transform and accumulated with the spectral `weights`.
+        Each monochromatic component is normalized to unit energy.
+
+        Returns p, q, psf as `psf()` (but centered, not in FFT order).
+        """
+        if wavelengths is None:
+            wavelengths, weights = self.system.spectrum()
+        wavelengths = np.atleast_1d(wavelengths)
+        if weights is None:
+            weights = np.ones(wavelengths.shape)/wavelengths.size
+        radius = self.system[-1].distance
+        self.rays_batch(yo, wavelengths, nrays, distribution, **kwargs)
+        xs, ys, os = [], [], []
+        for t in self.split():
+            x, y, o = t.opd(resample=resample, radius=radius)
+            xs.append(x[:, 0])
+            ys.append(y[0])
+            os.append(o)
+        m = max(o.shape[0] for o in os)
+        pupils = np.zeros((len(os), m, m), np.complex128)
+        xx, yy = np.zeros((2, len(os), m))
+        for i, (x, y, o) in enumerate(zip(xs, ys, os)):
+            good = np.isfinite(o)
+            pupils[i, :o.shape[0], :o.shape[1]] = np.where(
+                good, np.exp(-2j*np.pi*o), 0)
+            xx[i, :x.size], yy[i, :y.size] = x, y
+        k = self.system.scale/wavelengths/radius
+        dx = xx[:, 1] - xx[:, 0]
+        if n is None:
+            n = pad*m
+        if dp is None:
+            dp = (1/(k*dx)).min()/n
+        p = (np.arange(n) - n//2)*dp
+        psf = mft_psf(pupils, xx, yy, k, p, p)
+        energy = np.square(np.abs(pupils)).sum((1, 2))
+        psf *= (np.square(k*dx*dp)/energy)[:, None, None]
+        psf = np.tensordot(weights, psf, 1)
+        p, q = np.broadcast_arrays(p[:, None], p)
         return p, q, psf
 
+    def rays_grid(self, yo, wavelength=None, n=32, stop=None, clip=False):
+        """Trace the chief ray followed by a regular `n` by `n` grid of
+        rays over the entrance pupil. Rays outside the (vignetted) pupil
+        are traced with zero weight. `opd()` and `psf()` then work on
+        the ray grid directly, without resampling."""
+        z, p = self.system.pupil(yo, l=wavelength, stop=stop)
+        g = np.linspace(-1, 1, n)
+        yp = np.r_[[[0, 0]], np.c_[np.repeat(g, n), np.tile(g, n)]]
+        pupil = self.system.object.pupil
+        w = pupil.inside(pupil.map(yp, p, filter=False), p)*1.
+        w[0] = 0
+        y, u = self.system.aim(yo, yp, z, p, filter=False)
+        self.rays_given(y, u, wavelength, w/w.sum())
+        self.grid = n
+        self.pupil_points = yp
+        self.propagate(clip=clip)
+
+    def rays_spectrum(self, yo, nrays=11, distribution="meridional",
+                      **kwargs):
+        """Trace `rays_batch()` over the system spectrum with the ray
+        weights of each wavelength scaled by its spectral weight, such
+        that `rms()` and the weights are polychromatic."""
+        l, w = self.system.spectrum()
+        self.rays_batch(yo, l, nrays, distribution, **kwargs)
+        for yoi, li, s, ref in self.batch:
+            wi = w[np.argmin(np.fabs(l - li))]
+            self.w[s] *= wi/self.w[s].sum()
+        self.w /= self.w.sum()
+
     def rms(self, i=-1, ref=None):
         y = self.y[i, :, :2]
         if ref is None:
@@ -185,6 +550,37 @@ class GeometricTrace(Trace):
         r = (r*w).sum()
         return np.sqrt(r)
 
+    def rays_stream(self, yo, pupils, wavelength=None, stop=None,
+                    filter=None, clip=False, stats=None, opd=True):
+        """Trace the normalized pupil coordinates from `pupils`, an
+        iterable of chunks `(xy, weight)` as from `pupil_chunks()`, at
+        field `yo` one chunk at a time and accumulate the image plane
+        statistics into `stats` (a new `SpotStatistics` by default),
+        which is returned.
+
+        Memory use is bounded by the chunk size. The chief ray is traced
+        with each chunk (with zero weight) as the OPD reference.
+        """
+        if filter is None:
+            filter = not clip
+        if stats is None:
+            stats = SpotStatistics()
+        z, p = self.system.pupil(yo, l=wavelength, stop=stop)
+        pupil = self.system.object.pupil
+        for yp, w in pupils:
+            yp = np.concatenate([[[0, 0]], yp])
+            w = np.concatenate([[0], w])
+            if filter:
+                keep = pupil.inside(pupil.map(yp, p, filter=False), p)
+                keep[0] = True
+                yp, w = yp[keep], w[keep]
+            y, u = self.system.aim(yo, yp, z, p, filter=False)
+            self.rays_given(y, u, wavelength, w, ref=0)
+            self.propagate(clip=clip)
+            o = self.opd(resample=False)[2] if opd else None
+            stats.add(self.y[-1, :, :2], tanarcsin(self.i[-1]), w, o)
+        return stats
+
     def rays_paraxial(self, paraxial=None):
         if paraxial is None:
             paraxial = self.system.paraxial
@@ -200,8 +596,15 @@ class GeometricTrace(Trace):
         if filter is None:
             filter = not clip
         z, p = self.system.pupil(yo, l=wavelength, stop=stop)
+        if filter:
+            # drop the points and weights of the rays filtered in aim()
+            pupil = self.system.object.pupil
+            good = pupil.inside(pupil.map(yp, p, filter=False), p)
+            if weight is not None:
+                weight = weight[good]
         y, u = self.system.aim(yo, yp, z, p, filter=filter)
         self.rays_given(y, u, wavelength, weight, ref)
+        self.pupil_points = yp[good] if filter else yp
         self.propagate(clip=clip)
 
     def rays_point(self, yo, wavelength=None, nrays=11,
@@ -210,6 +613,72 @@ class GeometricTrace(Trace):
         ref, yp, weight = pupil_distribution(distribution, nrays)
         self.rays(yo, yp, wavelength, filter=filter, stop=stop,
                   clip=clip, weight=weight, ref=ref)
+        self.sampling = distribution, nrays
+
+    def rays_batch(self, yo, wavelengths=None, nrays=11,
+                   distribution="meridional", filter=None, stop=None,
+                   clip=False):
+        """Trace the rays of `rays_point()` for each combination of field
+        point in `yo` and wavelength in `wavelengths` in one propagation.
+
+        The members are ordered field-major. Use `split()` to obtain
+        the individual traces.
+        """
+        if wavelengths is None:
+            wavelengths = self.system.wavelengths
+        if filter is None:
+            filter = not clip
+        ref, yp, weight = pupil_distribution(distribution, nrays)
+        pupil = self.system.object.pupil
+        ys, us, ls, ws, batch = [], [], [], [], []
+        k = 0
+        for yoi in np.atleast_2d(yo):
+            for li in wavelengths:
+                z, p = self.system.pupil(yoi, l=li, stop=stop)
+                w, r = weight, ref
+                if filter:
+                    # drop the weights of the rays filtered in aim()
+                    good = pupil.inside(pupil.map(yp, p, filter=False), p)
+                    if w is not None:
+                        w = w[good]
+                    r = np.count_nonzero(good[:ref])
+                y, u = self.system.aim(yoi, yp, z, p, filter=filter)
+                m = y.shape[0]
+                if w is None:
+                    w = np.ones(m)/m
+                ys.append(y)
+                us.append(u)
+                ls.append(np.ones(m)*li)
+                ws.append(w)
+                batch.append((yoi, li, slice(k, k + m), k + r))
+                k += m
+        self.rays_given(np.concatenate(ys), np.concatenate(us),
+                        np.concatenate(ls), np.concatenate(ws),
+                        batch[0][3])
+        self.batch = batch
+        self.propagate(clip=clip)
+
+    def split(self):
+        """Return a trace for each member of a `rays_batch()` trace.
+
+        The member traces are views into the arrays of this trace.
+        """
+        traces = []
+        for yo, l, s, ref in self.batch:
+            t = self.__class__(self.system, self.surfaces, self.dtype,
+                               self.callback)
+            t.length, t.nrays, t.batch = self.length, s.stop - s.start, None
+            t.rows, t.grid = self.rows, None
+            t.pupil_points = t.sampling = None
+            t.y, t.u, t.i, t.t = (a[:, s] for a in
+                                  (self.y, self.u, self.i, self.t))
+            t.n = self.n[:, s.start]
+            t.w, t.ref, t.l = self.w[s], ref - s.start, l
+            t.path, t.track = self.path, self.track
+            t.clip, t.stamps = self.clip, self.stamps
+            t.origins, t.mirrored = self.origins, self.mirrored
+            traces.append(t)
+        return traces
 
     def rays_clipping(self, yo, wavelength=None, axis=1):
         z, p = self.system.pupil(yo, l=wavelength, stop=-1)
@@ -219,35 +688,42 @@ class GeometricTrace(Trace):
 
     def rays_line(self, yo, wavelength=None, nrays=21, eps=1e-2):
         yi = np.linspace(0, 1, nrays)[:, None]*np.atleast_2d(yo)
-        y = np.empty((3, nrays, 3))
-        u = np.empty_like(y)
         e = np.zeros((3, 2))  # chief, meridional, sagittal
         e[(1, 2), (1, 0)] = eps
         z, p = self.system.pupil((0, 0), l=wavelength)
-        for i in range(yi.shape[0]):
-            z = self.system.aim_chief(yi[i], z, np.fabs(p).max(),
-                                      l=wavelength)
-            y[:, i], u[:, i] = self.system.aim(yi[i], e, z, p)
-        self.rays_given(y.reshape(-1, 3), u.reshape(-1, 3), wavelength)
+        z = self.system.aim_chiefs(yi, z, np.fabs(p).max(), l=wavelength)
+        # ray i*nrays + j is of type e[i] at field yi[j]
+        y, u = self.system.aim(np.tile(yi, (3, 1)), np.repeat(e, nrays, 0),
+                               np.tile(z, 3), p)
+        self.rays_given(y, u, wavelength)
         self.propagate()
 
     def resize(self, fn=lambda a, b: a):
+        if not self.full:
+            raise ValueError("resize() needs all rows stored")
         r = np.hypot(self.y[:, :, 0], self.y[:, :, 1])
         for e, ri in zip(self.system[1:], r[1:]):
             e.radius = fn(ri.max(), e.radius)
 
     def plot(self, ax, axis=1, **kwargs):
+        if not self.full:
+            raise ValueError("plot() needs all rows stored")
         kwargs.setdefault("color", "green")
         y = np.array([el.from_normal(yi) + oi for el, yi, oi
                       in zip(self.system, self.y, self.origins)])
         ax.plot(y[:, :, 2], y[:, :, axis], **kwargs)
 
     def print_trace(self):
+        if not self.full:
+            raise ValueError("print_trace() needs all rows stored")
         t = np.cumsum(self.t, axis=0) - self.path[:, None]
+        n = self.n
+        if n.ndim == 1:
+            n = n[:, None]*np.ones(self.nrays)
         for i in range(self.nrays):
             yield "ray %i" % i
             c = np.concatenate(
-                (self.n[:, None], self.path[:, None], t[:, i, None],
+                (n[:, i, None], self.path[:, None], t[:, i, None],
                  self.y[:, i, :], self.u[:, i, :]), axis=1)
             for _ in self.print_coeffs(
                     c, "n/track z/rel path/"
@@ -263,6 +739,180 @@ class GeometricTrace(Trace):
         return "\n".join(self.text())
 
 
+try:
+    from scipy import fft as _fft
+except ImportError:  # scipy < 1.4
+    _fft = None
+
+
+@public
+class FFTWorkspace(object):
+    """Zero-padded transform buffers that are kept and reused across
+    fields (and wavelengths) of the same size. Uses the scipy.fft
+    transforms with `workers` threads where available."""
+    def __init__(self, workers=None):
+        self.workers = workers
+        self.buffers = {}
+
+    def buffer(self, shape, dtype=np.complex128):
+        key = tuple(shape), np.dtype(dtype).str
+        b = self.buffers.get(key)
+        if b is None:
+            b = self.buffers[key] = np.empty(shape, dtype)
+        return b
+
+    def psf(self, o, shape):
+        """Intensity of the zero-padded `shape` FFT of the pupil
+        function `o` (stacked along leading axes), normalized like
+        `np.fft.fft2(o, shape)`"""
+        b = self.buffer(o.shape[:-2] + tuple(shape))
+        b[...] = 0
+        b[..., :o.shape[-2], :o.shape[-1]] = o
+        if _fft is None:
+            a = np.fft.fft2(b)
+        else:
+            a = _fft.fft2(b, overwrite_x=True, workers=self.workers)
+        return (np.square(a.real) + np.square(a.imag))/(shape[0]*shape[1])
+
+    def otf(self, psf):
+        """Real to complex FFT of the real `psf` (last axis halved)"""
+        if _fft is None:
+            return np.fft.rfft2(psf)
+        return _fft.rfft2(psf, workers=self.workers)
+
+
+def psf_mtf(psf, dp, dq, workspace=None):
+    """Modulation transfer function of the (stacked) `psf` sampled with
+    spacings `dp`, `dq`: the modulus of its FFT normalized to unity at
+    zero frequency. Returns the frequencies fp, fq and the MTF (last
+    axis halved, fq non-negative)."""
+    if workspace is None:
+        workspace = FFTWorkspace()
+    m = np.abs(workspace.otf(psf))
+    m /= m[..., :1, :1]
+    fp = np.fft.fftfreq(psf.shape[-2], dp)
+    fq = np.fft.rfftfreq(psf.shape[-1], dq)
+    return fp, fq, m
+
+
+def mtf_slices(fp, fq, mtf):
+    """Sagittal (along fp) and tangential (along fq) non-negative
+    frequency slices of the `psf_mtf()` output for fields along the
+    y axis: fs, ms, ft, mt"""
+    i = (fp.size + 1)//2
+    return fp[:i], mtf[..., :i, 0], fq, mtf[..., 0, :]
+
+
+def mft_psf(pupils, x, y, k, p, q):
+    """Intensity of the matrix Fourier transforms of the stacked pupil
+    functions `pupils` (m, nx, ny) sampled at `x` (m, nx), `y` (m, ny)
+    onto the image plane grid `p`, `q` with the wave number scales `k`
+    (m,): |sum(pupil*exp(-2j*pi*k*(x*p + y*q)))|**2"""
+    k = np.asarray(k)[:, None, None]
+    ax = np.exp(-2j*np.pi*k*p[None, :, None]*x[:, None, :])
+    ay = np.exp(-2j*np.pi*k*y[:, :, None]*q[None, None, :])
+    a = np.matmul(np.matmul(ax, pupils), ay)
+    return np.square(a.real) + np.square(a.imag)
+
+
+@public
+class SpotStatistics(object):
+    """Running weighted statistics of rays added in chunks: image
+    plane centroid, rms spot radius, rms wavefront error, best focus
+    and encircled energy.
+
+    Positions are accumulated relative to the first ray added (the chief
+    ray in `GeometricTrace.rays_stream()`), the encircled energy is
+    histogrammed in radius around it with `bins` bins up to `rmax`
+    (twice the largest radius of the first chunk if None). The weight
+    of rays beyond `rmax` is accumulated in `overflow`. Rays with
+    non-finite intercepts are ignored.
+    """
+    def __init__(self, rmax=None, bins=128):
+        self.rmax = rmax
+        self.bins = bins
+        self.origin = None
+        self.hist = np.zeros(bins)
+        self.overflow = 0.
+        self.rfar = 0.
+        self.n = 0
+        self.w = 0.
+        self.wy = np.zeros(2)
+        self.wyy = 0.
+        self.wu = np.zeros(2)
+        self.wyu = 0.
+        self.wuu = 0.
+        self.wo = 0.
+        self.wo1 = 0.
+        self.wo2 = 0.
+
+    def add(self, y, u, w, opd=None):
+        """Add rays with image plane intercepts `y` (n, 2), slopes `u`
+        (n, 2, tangents), weights `w` (n,) and optionally optical path
+        differences `opd` (n,)"""
+        good = np.all(np.isfinite(y), axis=1) & np.all(np.isfinite(u),
+                                                       axis=1)
+        if self.origin is None:
+            self.origin = y[np.argmax(good)].copy()
+        y, u, w = y[good] - self.origin, u[good], w[good]
+        self.n += np.count_nonzero(w)
+        self.w += w.sum()
+        self.wy += np.dot(w, y)
+        self.wyy += np.dot(w, np.square(y).sum(1))
+        self.wu += np.dot(w, u)
+        self.wyu += np.dot(w, (y*u).sum(1))
+        self.wuu += np.dot(w, np.square(u).sum(1))
+        if opd is not None:
+            o = opd[good]
+            g = np.isfinite(o)
+            o, wo = o[g], w[g]
+            self.wo += wo.sum()
+            self.wo1 += np.dot(wo, o)
+            self.wo2 += np.dot(wo, np.square(o))
+        r = np.sqrt(np.square(y).sum(1))
+        if self.rmax is None:
+            self.rmax = 2*r.max() if r.size and r.max() > 0 else 1.
+        self.hist += np.histogram(r, self.bins, (0, self.rmax), weights=w)[0]
+        far = r > self.rmax
+        if np.any(far):
+            self.overflow += w[far].sum()
+            self.rfar = max(self.rfar, r[far].max())
+
+    @property
+    def centroid(self):
+        return self.origin + self.wy/self.w
+
+    @property
+    def rms(self):
+        """Rms spot radius around the centroid"""
+        c = self.wy/self.w
+        return np.sqrt(max(0, self.wyy/self.w - np.square(c).sum()))
+
+    @property
+    def rms_opd(self):
+        """Rms optical path difference (piston removed)"""
+        m = self.wo1/self.wo
+        return np.sqrt(max(0, self.wo2/self.wo - m**2))
+
+    @property
+    def focus(self):
+        """Distance to the best (minimum rms) focus, as in
+        `GeometricTrace.refocus()`"""
+        y, u = self.wy/self.w, self.wu/self.w
+        return -(self.wyu/self.w - np.dot(y, u))/(
+            self.wuu/self.w - np.dot(u, u))
+
+    def encircled(self):
+        """Radii around the first ray and the fraction of the energy
+        within them. If rays fell beyond `rmax`, the largest of their
+        radii is appended."""
+        r = np.linspace(0, self.rmax, self.bins + 1)
+        e = np.r_[0, np.cumsum(self.hist)]
+        if self.overflow:
+            r, e = np.r_[r, self.rfar], np.r_[e, e[-1] + self.overflow]
+        return r, e/self.w
+
+
 # alias
 @public
 class FullTrace(GeometricTrace):
@@ -25,6 +25,7 @@ import numpy as np
 from fastcache import clru_cache
 
 from .name_mixin import NameMixin
+from .stamp_mixin import StampMixin
 from .utils import public
 
 
@@ -79,7 +80,7 @@ class Thermal(object):
 
 
 @public
-class Material(NameMixin):
+class Material(NameMixin, StampMixin):
     def __init__(self, name="-", solid=True, mirror=False, catalog=None,
                  thermal=None):
         self.name = name
@@ -141,6 +142,10 @@ class Material(NameMixin):
     def refractive_index(self, wavelength):
         return 1.
 
+    def refractive_indices(self, wavelengths):
+        """Refractive indices for an array of wavelengths (not cached)"""
+        return np.ones(np.shape(wavelengths))
+
     def dispersion(self, short, mid, long):
         dn = self.delta_n(short, long)
         if dn:
@@ -169,6 +174,9 @@ class ModelMaterial(Material):
     def refractive_index(self, wavelength):
         return self.n
 
+    def refractive_indices(self, wavelengths):
+        return np.full(np.shape(wavelengths), self.n, dtype=np.float64)
+
     def dict(self):
         dat = super(ModelMaterial, self).dict()
         dat["n"] = self.n
@@ -203,7 +211,10 @@ class AbbeMaterial(Material):
 
     @clru_cache(maxsize=1024)
     def refractive_index(self, wavelength):
-        return (self.n + (wavelength - self.lambda_ref) /
+        return self.refractive_indices(wavelength)
+
+    def refractive_indices(self, wavelengths):
+        return (self.n + (np.asarray(wavelengths) - self.lambda_ref) /
                 (self.lambda_long - self.lambda_short) *
                 (1 - self.n)/self.v)
 
@@ -231,14 +242,19 @@ class CoefficientsMaterial(Material):
 
     @clru_cache(maxsize=1024)
     def refractive_index(self, wavelength):
+        return self.refractive_indices(wavelength)
+
+    def refractive_indices(self, wavelengths):
         n = getattr(self, "n_%s" % self.typ)
-        n = n(wavelength/1e-6, self.coefficients)
+        n = n(np.asarray(wavelengths)/1e-6, self.coefficients)
         if self.mirror:
             n = -n
         return n
 
     # http://refractiveindex.info/download/database/rii-database-2015-03-11.zip
     # http://home.comcast.net/~mbiegert/Blog/DispersionCoefficient/dispeqns.pdf
+    # w: wavelength(s) in um, scalar or array, sums over the
+    # coefficients run along a trailing axis
 
     def n_schott(self, w, c):
         n = c[0] + c[1]*w**2
@@ -247,19 +263,19 @@ class CoefficientsMaterial(Material):
         return np.sqrt(n)
 
     def n_sellmeier(self, w, c):
-        w2 = w**2
+        w2 = w[..., None]**2
         c0, c1 = c.reshape(-1, 2).T
-        return np.sqrt(1. + (c0*w2/(w2 - c1**2)).sum())
+        return np.sqrt(1. + (c0*w2/(w2 - c1**2)).sum(-1))
 
     def n_sellmeier_squared(self, w, c):
-        w2 = w**2
+        w2 = w[..., None]**2
         c0, c1 = c.reshape(-1, 2).T
-        return np.sqrt(1. + (c0*w2/(w2 - c1)).sum())
+        return np.sqrt(1. + (c0*w2/(w2 - c1)).sum(-1))
 
     def n_sellmeier_squared_transposed(self, w, c):
-        w2 = w**2
+        w2 = w[..., None]**2
         c0, c1 = c.reshape(2, -1)
-        return np.sqrt(1. + (c0*w2/(w2 - c1)).sum())
+        return np.sqrt(1. + (c0*w2/(w2 - c1)).sum(-1))
 
     def n_conrady(self, w, c):
         return c[0] + c[1]/w + c[2]/w**3.5
@@ -269,14 +285,14 @@ class CoefficientsMaterial(Material):
         return c[0] + c[1]*l + c[2]*l**2 + c[3]*w**2 + c[4]*w**4 + c[5]*w**6
 
     def n_sellmeier_offset(self, w, c):
-        w2 = w**2
+        w2 = w[..., None]**2
         c0, c1 = c[1:1 + (c.shape[0] - 1)//2*2].reshape(-1, 2).T
-        return np.sqrt(1. + c[0] + (c0*w2/(w2 - c1**2)).sum())
+        return np.sqrt(1. + c[0] + (c0*w2/(w2 - c1**2)).sum(-1))
 
     def n_sellmeier_squared_offset(self, w, c):
-        w2 = w**2
+        w2 = w[..., None]**2
         c0, c1 = c[1:1 + (c.shape[0] - 1)//2*2].reshape(-1, 2).T
-        return np.sqrt(1. + c[0] + (c0*w2/(w2 - c1)).sum())
+        return np.sqrt(1. + c[0] + (c0*w2/(w2 - c1)).sum(-1))
 
     def n_handbook_of_optics1(self, w, c):
         return np.sqrt(c[0] + (c[1]/(w**2 - c[2])) - (c[3]*w**2))
@@ -298,7 +314,7 @@ class CoefficientsMaterial(Material):
 
     def n_gas(self, w, c):
         c0, c1 = c.reshape(2, -1)
-        return 1. + (c0/(c1 - w**-2)).sum()
+        return 1. + (c0/(c1 - w[..., None]**-2)).sum(-1)
 
     def n_gas_offset(self, w, c):
         return c[0] + self.n_gas(w, c[1:])
@@ -306,7 +322,8 @@ class CoefficientsMaterial(Material):
     def n_refractiveindex_info(self, w, c):
         c0, c1 = c[9:].reshape(-1, 2).T
         return np.sqrt(c[0] + c[1]*w**c[2]/(w**2 - c[3]**c[4]) +
-                c[5]*w**c[6]/(w**2 - c[7]**c[8]) + (c0*w**c1).sum())
+                c[5]*w**c[6]/(w**2 - c[7]**c[8]) +
+                (c0*w[..., None]**c1).sum(-1))
 
     def n_retro(self, w, c):
         w2 = w**2
@@ -315,7 +332,7 @@ class CoefficientsMaterial(Material):
 
     def n_cauchy(self, w, c):
         c0, c1 = c[1:].reshape(-1, 2).T
-        return c[0] + (c0*w**c1).sum()
+        return c[0] + (c0*w[..., None]**c1).sum(-1)
 
     def n_polynomial(self, w, c):
         return np.sqrt(self.n_cauchy(w, c))
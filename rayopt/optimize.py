@@ -23,8 +23,15 @@ from fastcache import clru_cache
 import numpy as np
 from scipy.optimize import minimize
 
+from .geometric_trace import GeometricTrace
+from .utils import field_quadrature
+
 
 class Variable:
+    # (element index, name) as understood by GeometricTrace.jacobian()
+    # if analytic derivatives are available
+    param = None
+
     def __init__(self, system, bounds=(-np.inf, np.inf),
                  scale=None, init=None):
         self.system = system
@@ -48,6 +55,12 @@ class Variable:
 class PathVariable(Variable):
     def __init__(self, system, path, *args, **kwargs):
         self.path = path
+        path = tuple(path)
+        if len(path) == 2 and path[1] in ("curvature", "conic",
+                                          "distance"):
+            self.param = path
+        elif path[1:] == ("material", "n"):
+            self.param = path[0], "n"
         super(PathVariable, self).__init__(system, *args, **kwargs)
 
     def get(self):
@@ -58,6 +71,9 @@ class PathVariable(Variable):
 
 
 class Operand:
+    # jac(variables) -> derivatives of get() (len(get()), len(variables))
+    jac = None
+
     def __init__(self, system, weight=None, offset=0,
                  min=None, max=None):
         self.system = system
@@ -86,13 +102,113 @@ class Operand:
 
 class FuncOp(Operand):
     def __init__(self, system, func, *args, **kwargs):
+        jac = kwargs.pop("jac", None)
         super(FuncOp, self).__init__(system, *args, **kwargs)
         self.func = func
+        if jac is not None:
+            self.jac = lambda variables: jac(self.system, variables)
 
     def get(self):
         return np.atleast_1d(self.func(self.system)).ravel()
 
 
+class SpotOp(Operand):
+    """Transverse ray aberrations in the image plane with respect to
+    the chief ray. The rays are aimed once and kept fixed, their
+    derivatives are obtained from GeometricTrace.jacobian()."""
+    def __init__(self, system, yo=(0, 0), wavelength=None, nrays=13,
+                 distribution="radau", *args, **kwargs):
+        super(SpotOp, self).__init__(system, *args, **kwargs)
+        self.trace = GeometricTrace(system)
+        self.trace.rays_point(yo, wavelength, nrays=nrays,
+                              distribution=distribution, filter=False)
+        t = self.trace
+        self.rays = t.y[0].copy(), t.u[0].copy(), t.l, t.w, t.ref
+
+    def get(self):
+        y, u, l, w, ref = self.rays
+        self.trace.rays_given(y, u, l, w, ref)
+        self.trace.propagate()
+        y = self.trace.y[-1, :, :2]
+        return (y - y[self.trace.ref]).ravel()
+
+    def jac(self, variables):
+        dy, du, dt = self.trace.jacobian([v.param for v in variables])
+        dy = dy[:, -1, :, :2]
+        dy = dy - dy[:, self.trace.ref, None]
+        return dy.reshape(len(variables), -1).T
+
+
+class QuadratureOp(Operand):
+    """Merit over the field and the pupil evaluated with Gaussian
+    quadrature: `fields` heights of `field_quadrature()` and about
+    `nrays` rays per field of the "gauss" `disk_quadrature()` (over
+    the x >= 0 half pupil). `get()` returns one value per field scaled
+    by the square root of the field weight such that the sum of squares
+    is the field average."""
+    def __init__(self, system, fields=3, nrays=21, wavelength=None,
+                 *args, **kwargs):
+        super(QuadratureOp, self).__init__(system, *args, **kwargs)
+        self.heights, self.field_weights = field_quadrature(fields)
+        self.nrays = nrays
+        self.wavelength = wavelength
+        self.trace = GeometricTrace(system)
+
+    def traces(self):
+        l = self.wavelength
+        if l is None:
+            l = self.system.wavelengths[0]
+        self.trace.rays_batch([(0, h) for h in self.heights], [l],
+                              nrays=self.nrays, distribution="gauss",
+                              filter=False)
+        return self.trace.split()
+
+    def field(self, t):
+        raise NotImplementedError
+
+    def get(self):
+        return np.sqrt(self.field_weights)*[
+            self.field(t) for t in self.traces()]
+
+
+class RmsSpotOp(QuadratureOp):
+    """RMS spot radius around the centroid"""
+    def field(self, t):
+        y, w = t.y[-1, :, :2], t.w
+        c = np.dot(w, y)
+        c[0] = y[t.ref, 0]  # symmetric in x
+        return np.sqrt(np.dot(w, np.square(y - c).sum(1)))
+
+
+class RmsOpdOp(QuadratureOp):
+    """RMS optical path difference (piston removed) in waves"""
+    def field(self, t):
+        o = t.opd(resample=False)[2]
+        m = np.dot(t.w, o)
+        return np.sqrt(np.dot(t.w, np.square(o - m)))
+
+
+class DistortionOp(Operand):
+    """Relative distortion of the chief ray image height at the
+    normalized field `heights` with respect to the image height scaled
+    from a near axis chief ray at height `eps`"""
+    def __init__(self, system, heights=(1.,), wavelength=None, eps=1e-3,
+                 *args, **kwargs):
+        super(DistortionOp, self).__init__(system, *args, **kwargs)
+        self.heights = np.r_[eps, heights]
+        self.wavelength = wavelength
+        self.trace = GeometricTrace(system)
+
+    def get(self):
+        l = self.wavelength
+        if l is None:
+            l = self.system.wavelengths[0]
+        self.trace.rays_batch([(0, h) for h in self.heights], [l],
+                              nrays=1)
+        y = self.trace.y[-1, :, 1]/self.heights
+        return y[1:]/y[0] - 1
+
+
 def optimize(variables, operands, callback=None, tol=1e-4, options={},
              trace=False, **kwargs):
     assert variables
@@ -112,13 +228,23 @@ def optimize(variables, operands, callback=None, tol=1e-4, options={},
             ineq.append((i, ineqi))
     assert ob
 
+    systems = []
+    for op in operands:
+        if not any(op.system is si for si in systems):
+            systems.append(op.system)
+    # the x of the current system state
+    traced = [None]
+
     def up(x):
         for xi, vi in zip(x*s, variables):
             vi.set(xi)
+        for si in systems:
+            si.update()
+        traced[0] = tuple(x)
 
     @clru_cache(maxsize=len(variables) + 1)
     def ex(*x):
-        up(x)
+        up(np.array(x))
         return [op.get() for op in operands]
 
     def fun(x):
@@ -140,6 +266,34 @@ def optimize(variables, operands, callback=None, tol=1e-4, options={},
     if ineq:
         cons.append({"type": "ineq", "fun": fineq})
 
+    if (all(op.jac is not None for op in operands) and
+            all(vi.param is not None for vi in variables)):
+        @clru_cache(maxsize=1)
+        def exj(*x):
+            # the jacobians are taken at the traced state: retrace
+            # if ex() has traced a different x since
+            if traced[0] != x:
+                up(np.array(x))
+                for op in operands:
+                    op.get()
+            return [op.jac(variables)*s for op in operands]
+
+        def djac(fs, x):
+            # the objective and constraint functions are affine
+            v, j = ex(*x), exj(*x)
+            return np.concatenate([
+                (f(np.ones_like(v[i])) - f(np.zeros_like(v[i])))[:, None]
+                * j[i] for i, f in fs])
+
+        def jfun(x):
+            v = ex(*x)
+            o = np.concatenate([obi(v[i]) for i, obi in ob])
+            return 2*np.dot(o, djac(ob, x))
+
+        kwargs.setdefault("jac", jfun)
+        for c, fs in zip(cons, [f for f in (eq, ineq) if f]):
+            c["jac"] = lambda x, fs=fs: djac(fs, x)
+
     xi, vi, fi = [], [], []
 
     def cb(x):
@@ -25,6 +25,19 @@ import numpy as np
 
 from .utils import sinarctan, tanarcsin, public
 from .raytrace import Trace
+from .elements import Spheroid
+
+
+def object_rays(o, n0):
+    """Heights and n*slopes of the marginal and chief rays leaving the
+    object conjugate `o` into refractive index `n0`"""
+    if o.finite:
+        return (0, -o.radius), (n0*o.pupil.slope, n0*o.slope)
+    if o.wideangle:
+        c = 1.
+    else:
+        c = tanarcsin(o.angle)
+    return (o.pupil.radius, -o.slope*o.pupil.distance), (0, n0*c)
 
 
 @public
@@ -46,11 +59,27 @@ class ParaxialTrace(Trace):
         if update:
             self.update()
 
-    def update(self):
+    def update(self, full=False):
+        """Trace the paraxial rays. Unless `full`, only the part of the
+        system after the first element that changed since the last
+        update is retraced."""
+        stamps = tuple(self.system.wavelengths), self.system.stamps()
+        old = getattr(self, "_stamps", None)
+        if old is not None and old[0] == stamps[0]:
+            start = self.system.first_change(old[1])
+        else:
+            start = 0
         self.allocate()
+        yu = self.y[0].copy(), self.u[0].copy(), self.n[0]
         self.rays()
-        self.propagate()
-        self.aberrations()
+        if full or not (np.all(yu[0] == self.y[0]) and
+                        np.all(yu[1] == self.u[0]) and yu[2] == self.n[0]):
+            start = 0
+        if start is not None:
+            start = max(start, 1)
+            self.propagate(start)
+            self.aberrations(start)
+        self._stamps = stamps
 
     @property
     def wavelength(self):
@@ -68,18 +97,7 @@ class ParaxialTrace(Trace):
 
     def rays(self):
         self.n[0] = n0 = self.system.refractive_index(self.wavelength, 0)
-        y, u = self.y, self.u
-        o = self.system.object
-        if o.finite:
-            y[0] = 0, -o.radius
-            u[0] = n0*o.pupil.slope, n0*o.slope
-        else:
-            if self.system.object.wideangle:
-                c = 1.
-            else:
-                c = tanarcsin(self.system.object.angle)
-            y[0] = o.pupil.radius, -o.slope*o.pupil.distance
-            u[0] = 0, n0*c
+        self.y[0], self.u[0] = object_rays(self.system.object, n0)
 
     def propagate(self, start=1, stop=None):
         super(ParaxialTrace, self).propagate()
@@ -95,12 +113,20 @@ class ParaxialTrace(Trace):
             self.n[j] = n
 
     def aberrations(self, start=1, stop=None):
-        self.c[start - 1] = 0
-        v = 0
         l1, l2 = min(self.system.wavelengths), max(self.system.wavelengths)
+        # dispersion of the elements, from the index table
+        n = self.system.refractive_indices((l1, l2))
+        dn = [n[i, 0] - n[i, 1]
+              if getattr(el, "material", None) is not None else 0
+              for i, el in enumerate(self.system)]
+        if start == 1:
+            self.c[0] = 0
+            v = 0
+        else:
+            v = dn[start - 1]
         for i, el in enumerate(self.system[start:stop]):
             i += start
-            v0, v = v, el.dispersion(l1, l2)
+            v0, v = v, dn[i]
             self.c[i] = el.aberration(self.y[i], self.u[i - 1], self.u[i],
                                       self.n[i - 1], self.n[i], v0, v)
 
@@ -356,3 +382,218 @@ class ParaxialTrace(Trace):
         u = tanarcsin(u)
         y, u = np.dot(m, (y[0, 1], u[0, 1]))
         self.system[ai].radius = y
+
+
+@public
+class ParaxialBatch(object):
+    """Paraxial marginal and chief ray traces of many systems (or
+    configurations of one system) at once.
+
+    The element parameters are stacked into (nsystems, length) arrays,
+    the element matrices built as (nsystems, length, 4, 4) and applied
+    with batched matrix products. Shorter systems are padded with
+    identity elements before their image so that the object (0), the
+    last surface (-2) and the image (-1) line up. The object and image
+    conjugates are used as they are (see `System.update()`).
+
+    The arrays `y, u, n, c` and the properties are those of
+    `ParaxialTrace` with a leading system axis.
+    """
+    def __init__(self, systems, axis=1):
+        self.systems = list(systems)
+        self.axis = axis
+        self.stack()
+        self.propagate()
+        self.aberrations()
+
+    def stack(self):
+        ns = len(self.systems)
+        self.length = nl = max(len(s) for s in self.systems)
+        self.wavelength = np.empty(ns)
+        self.n = np.empty((ns, nl))
+        self.dispersion = np.zeros((ns, nl))
+        self.distance = np.zeros((ns, nl))
+        self.curvature = np.zeros((ns, nl))
+        self.fourth = np.zeros((ns, nl))
+        self.theta = np.zeros((ns, nl))
+        self.phi = np.zeros((ns, nl))
+        self.spheroid = np.zeros((ns, nl), bool)
+        self.mirror = np.zeros((ns, nl), bool)
+        self.rotated = np.zeros((ns, nl), bool)
+        self.finite = np.empty((ns, 2), bool)
+        self.y0, self.u0 = np.empty((ns, 2)), np.empty((ns, 2))
+        # materials are usually shared between the systems:
+        # look up each one once (as `System.refractive_indices()`)
+        indices = {}
+        for i, s in enumerate(self.systems):
+            l = s.wavelengths
+            l = l[0], min(l), max(l)
+            self.wavelength[i] = l[0]
+            m = len(s)
+            n = np.ones((m, 3))
+            for j, e in enumerate(s):
+                material = getattr(e, "material", None)
+                if material is None:
+                    n[j] = n[j - 1] if j else 1.
+                    continue
+                key = id(material), l
+                if key not in indices:
+                    indices[key] = material.refractive_indices(l)
+                n[j] = indices[key]
+            # padding repeats the last surface before the image
+            k = np.r_[np.arange(m - 1), np.ones(nl - m, int)*(m - 2), m - 1]
+            self.n[i] = n[k, 0]
+            dn = n[:, 1] - n[:, 2]
+            dn *= [getattr(e, "material", None) is not None for e in s]
+            self.dispersion[i] = dn[k]
+            self.y0[i], self.u0[i] = object_rays(s.object, n[0, 0])
+            self.finite[i] = s.object.finite, s.image.finite
+            for j, e in zip(np.r_[np.arange(1, m - 1), nl - 1], s[1:]):
+                self.distance[i, j] = e.distance
+                if not isinstance(e, Spheroid):
+                    continue
+                self.spheroid[i, j] = True
+                self.curvature[i, j], self.fourth[i, j] = \
+                    e.paraxial_curvature()
+                self.mirror[i, j] = (e.material is not None and
+                                     e.material.mirror)
+                if e.angles is not None:
+                    self.rotated[i, j] = True
+                    self.theta[i, j], self.phi[i, j] = e.angles[0::2]
+        # the object space dispersion is not counted
+        self.dispersion[:, 0] = 0
+
+    def element_matrices(self):
+        """(nsystems, length, 4, 4) paraxial matrices of the elements
+        as `Spheroid.paraxial_matrix()`"""
+        n = self.n
+        n0 = np.c_[n[:, :1], n[:, :-1]]
+        c, costheta = self.curvature, np.cos(self.theta)
+        eye = np.eye(4)
+        md = np.tile(eye, n.shape + (1, 1))
+        md[..., 0, 2] = md[..., 1, 3] = self.distance/n0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mu = n/n0
+            p = np.sqrt(mu**2 + costheta**2 - 1)
+            m11 = p/(mu*costheta)
+            m20 = n0*c*(costheta - p)
+            m31 = mu*m20/(costheta*p)
+            m33 = 1/m11
+        mi = self.mirror
+        m = np.tile(eye, n.shape + (1, 1))
+        m[..., 1, 1] = np.where(mi, 1, m11)
+        m[..., 2, 0] = np.where(mi, 2*c*costheta, m20)
+        m[..., 3, 1] = np.where(mi, 2*c/costheta, m31)
+        m[..., 3, 3] = np.where(mi, 1, m33)
+        m = np.matmul(m, md)
+        if np.any(self.rotated):
+            cphi = np.where(self.rotated, np.cos(self.phi), 1)
+            sphi = np.where(self.rotated, np.sin(self.phi), 0)
+            r = np.zeros_like(m)
+            r[..., 0, 0] = r[..., 2, 2] = cphi
+            r[..., 0, 1] = r[..., 2, 3] = -sphi
+            r[..., 1, 0] = r[..., 3, 2] = sphi
+            r[..., 1, 1] = r[..., 3, 3] = np.where(self.rotated, -cphi, 1)
+            m = np.matmul(r, np.matmul(m, np.swapaxes(r, -1, -2)))
+        return m
+
+    def propagate(self):
+        self.matrices = m = self.element_matrices()
+        ns, nl = self.n.shape
+        self.y, self.u = np.empty((ns, nl, 2)), np.empty((ns, nl, 2))
+        self.y[:, 0], self.u[:, 0] = self.y0, self.u0
+        yu = np.empty((ns, 4, 2))
+        yu[:, :2], yu[:, 2:] = self.y0[:, None], self.u0[:, None]
+        for j in range(1, nl):
+            yu = np.matmul(m[:, j], yu)
+            self.y[:, j], self.u[:, j] = yu[:, self.axis], yu[:, 2 + self.axis]
+
+    def aberrations(self):
+        y = np.moveaxis(self.y[:, 1:], -1, 0)
+        u0 = np.moveaxis(self.u[:, :-1], -1, 0)
+        u = np.moveaxis(self.u[:, 1:], -1, 0)
+        n0, n = self.n[:, :-1], self.n[:, 1:]
+        n = np.where(self.mirror[:, 1:], -n, n)
+        v0, v = self.dispersion[:, :-1], self.dispersion[:, 1:]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            c = Spheroid.seidel(self.curvature[:, 1:], self.fourth[:, 1:],
+                                y, u0, u, n0, n, v0, v)
+        self.c = np.zeros(self.n.shape + (7,))
+        self.c[:, 1:] = np.where(self.spheroid[:, 1:, None],
+                                 np.stack(c, -1), 0)
+
+    @property
+    def matrix(self):
+        """(nsystems, 4, 4) paraxial matrices of the systems, reduced
+        pairwise"""
+        m = self.matrices[:, 1:]
+        while m.shape[1] > 1:
+            if m.shape[1] % 2:
+                m = np.concatenate((m, np.tile(np.eye(4), (
+                    m.shape[0], 1, 1, 1))), axis=1)
+            m = np.matmul(m[:, 1::2], m[:, ::2])
+        return m[:, 0]
+
+    @property
+    def transverse3(self):
+        return self.c*self.height[:, 1, None, None]
+
+    @property
+    def seidel(self):
+        """(nsystems, 7) sums of `transverse3` over the surfaces"""
+        return self.transverse3.sum(1)
+
+    @property
+    def height(self):
+        return np.fabs(self.y[:, (0, -1), 1])
+
+    @property
+    def pupil_distance(self):
+        return -self.y[:, (1, -2), 1]/self.u[:, (0, -2), 1]*self.n[:, (0, -2)]
+
+    @property
+    def pupil_height(self):
+        p = self.pupil_distance
+        return np.fabs(self.y[:, (1, -2), 0] +
+                       p*self.u[:, (0, -2), 0]/self.n[:, (0, -2)])
+
+    @property
+    def lagrange(self):
+        u, y = self.u[:, 0], self.y[:, 0]
+        return u[:, 0]*y[:, 1] - u[:, 1]*y[:, 0]
+
+    @property
+    def focal_length(self):
+        u = self.u
+        f = self.lagrange/(u[:, 0, 1]*u[:, -2, 0] - u[:, 0, 0]*u[:, -2, 1])
+        return f[:, None]*self.n[:, (-2, 0)]*(-1, 1)
+
+    @property
+    def focal_distance(self):
+        c = self.focal_length/self.lagrange[:, None]/self.n[:, (-2, 0)]
+        y, u = self.y, self.u
+        return (y[:, (1, -2), 1]*u[:, (-2, 0), 0] -
+                y[:, (1, -2), 0]*u[:, (-2, 0), 1])*c
+
+    @property
+    def principal_distance(self):
+        return self.focal_distance - self.focal_length
+
+    @property
+    def numerical_aperture(self):
+        n = self.n[:, (0, -2)]
+        na = n*sinarctan(self.u[:, (0, -2), 0]/n)
+        na[:, 1] = np.where(self.finite.all(1),
+                            na[:, 0]/self.magnification[:, 0], na[:, 1])
+        return np.fabs(na)
+
+    @property
+    def f_number(self):
+        return np.fabs(self.focal_length/(2*self.pupil_height))
+
+    @property
+    def magnification(self):
+        u, n = self.u, self.n
+        mt = u[:, 0, 0]/u[:, -2, 0]
+        ma = u[:, -2, 1]*n[:, 0]/(u[:, 0, 1]*n[:, -2])
+        return np.c_[mt, ma]
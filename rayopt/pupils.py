@@ -99,16 +99,26 @@ class Pupil(NameMixin):
 
     def map(self, y, a, filter=True):
         # FIXME: projection
-        # a = [[-sag, -mer], [+sag, +mer]]
-        am = np.fabs(a).max()
-        y = np.atleast_2d(y)*am
+        # a = [[-sag, -mer], [+sag, +mer]], or one such per ray
+        # or (unfiltered) just the (per ray) radius
+        a = np.asarray(a)
+        if a.ndim < 2:
+            am = np.fabs(a)
+        else:
+            am = np.fabs(a).max(axis=(-2, -1))
+        y = np.atleast_2d(y)*am[..., None]
         if filter:
-            c = np.sum(a, axis=0)/2
-            d = np.diff(a, axis=0)/2
-            r = ((y - c)**2/d**2).sum(1)
-            y = y[r <= 1]
+            y = y[self.inside(y, a)]
         return y
 
+    def inside(self, y, a):
+        """Mask of the mapped pupil coordinates `y` that lie within the
+        (vignetted) pupil `a`"""
+        a = np.asarray(a)
+        c = (a[..., 1, :] + a[..., 0, :])/2
+        d = (a[..., 1, :] - a[..., 0, :])/2
+        return ((y - c)**2/d**2).sum(1) <= 1
+
 
 @public
 @Pupil.register
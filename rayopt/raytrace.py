@@ -33,10 +33,11 @@ class Trace(object):
         self.length = len(self.system)
 
     def propagate(self):
-        self.path = self.system.path
-        self.track = self.system.track
-        self.origins = self.system.origins
-        self.mirrored = self.system.mirrored
+        g = self.system.geometry()
+        self.path = g.path
+        self.track = g.track
+        self.origins = g.origins
+        self.mirrored = g.mirrored
 
     def from_axis(self, y, i=None, ref=0):
         y = np.atleast_3d(y) # zi, rayi, xyz
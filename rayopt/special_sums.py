@@ -21,6 +21,7 @@ from __future__ import (absolute_import, print_function,
                         unicode_literals, division)
 
 import numpy as np
+from fastcache import clru_cache
 
 
 def angle_sum(m, angle, aspect=1., binsize=None):
@@ -148,7 +149,7 @@ def angle_sum(m, angle, aspect=1., binsize=None):
     #assert k.min() == km
     #assert k.max() == kp
     # output bin index
-    k = np.floor(k - (km - .5)).astype(np.int)
+    k = np.floor(k - (km - .5)).astype(int)
     return np.bincount(k.ravel(), m.ravel()) #, minlength=kp-km
 
 
@@ -162,13 +163,16 @@ def polar_sum(m, center, direction, aspect=1., binsize=None):
     center : tuple(float, float)
         The center of the summation measured from the [0, 0] index
         in units of the two input step sizes.
-    direction : "radial" or "azimuthal"
-        Summation direction.
+    direction : "radial", "azimuthal" or "square"
+        Summation direction. "square" sums over the perimeters of
+        squares around the center (the bins of ensquared energy).
     aspect : float, optional
         The input bin aspect ratio (second dimension/first dimension).
     binsize : int, optional
         The output bin size. If None is given, and direction="radial"
         then binsize=2*pi/100, else binsize=min(1, aspect).
+        The bin indices are cached per shape, center, direction, aspect
+        and binsize (see `polar_binning()`).
 
     Returns
     -------
@@ -240,29 +244,110 @@ def polar_sum(m, center, direction, aspect=1., binsize=None):
     1011
     """
     m = np.atleast_2d(m)
-    # original coordinates
-    i, j = np.ogrid[:m.shape[0], :m.shape[1]]
-    i, j = i - center[0], j - center[1]
-    # output coordinate
-    if direction == "azimuthal":
-        k = (j**2*aspect**2 + i**2)**.5
-        if binsize is None:
-            binsize = min(1., aspect)
-        minlength = None
-    elif direction == "radial":
-        k = np.arctan2(i, j*aspect) + np.pi
-        if binsize is None:
-            binsize = 2*np.pi/100
-        minlength = int(2*np.pi/binsize) + 1
-    else:
-        raise ValueError("direction needs to be 'radial' or 'azimuthal'")
-    k = (k/binsize).astype(np.int)
-    r = np.bincount(k.ravel(), m.ravel(), minlength)
-    if direction == "radial":
-        assert r.shape[0] == minlength, (r.shape, minlength)
-        r[0] += r[-1]
-        r = r[:-1]
-    return r
+    b = polar_binning(m.shape, tuple(center), direction, aspect, binsize)
+    return b.sum(m)
+
+
+class PolarBinning(object):
+    """Bin indices of `polar_sum()` for arrays of `shape`.
+
+    The indices are computed once and each `sum()` of one or many
+    stacked arrays (e.g. PSFs for many wavelengths or focus positions)
+    is a single `bincount`.
+
+    Examples
+    --------
+    >>> b = PolarBinning((3, 3), (1, 1), "azimuthal", binsize=1.)
+    >>> b.sum(np.arange(1., 10.).reshape((3, 3))).tolist()
+    [5.0, 40.0]
+    >>> b.sum(np.ones((2, 3, 3))).tolist()
+    [[1.0, 8.0], [1.0, 8.0]]
+    >>> b.mean(np.ones((3, 3))).tolist()
+    [1.0, 1.0]
+    >>> b = PolarBinning((3, 3), (1, 1), "square")
+    >>> b.cumsum(np.ones((3, 3))).tolist()
+    [1.0, 9.0]
+    """
+    def __init__(self, shape, center, direction="azimuthal", aspect=1.,
+                 binsize=None):
+        self.shape = shape
+        # original coordinates
+        i, j = np.ogrid[:shape[0], :shape[1]]
+        i, j = i - center[0], j - center[1]
+        # output coordinate
+        if direction == "azimuthal":
+            k = (j**2*aspect**2 + i**2)**.5
+            if binsize is None:
+                binsize = min(1., aspect)
+            minlength = 0
+        elif direction == "square":
+            k = np.maximum(np.fabs(j*aspect), np.fabs(i))
+            if binsize is None:
+                binsize = min(1., aspect)
+            minlength = 0
+        elif direction == "radial":
+            k = np.arctan2(i, j*aspect) + np.pi
+            if binsize is None:
+                binsize = 2*np.pi/100
+            minlength = int(2*np.pi/binsize) + 1
+        else:
+            raise ValueError("direction needs to be 'radial', "
+                             "'azimuthal' or 'square'")
+        self.direction = direction
+        self.binsize = binsize
+        self.index = (k/binsize).astype(np.intp).ravel()
+        self.bins = max(minlength, self.index.max() + 1)
+        if direction == "radial":
+            assert self.bins == minlength, (self.bins, minlength)
+        self.counts = self._fold(np.bincount(self.index,
+                                             minlength=self.bins))
+
+    def _fold(self, r):
+        if self.direction == "radial":
+            # +pi is -pi
+            r[..., 0] += r[..., -1]
+            r = r[..., :-1]
+        return r
+
+    @property
+    def edges(self):
+        """Lower bin edges (radii or angles)"""
+        r = np.arange(self.counts.shape[0])*self.binsize
+        if self.direction == "radial":
+            r -= np.pi
+        return r
+
+    def sum(self, m):
+        """Binned sums of `m` of shape (..., N, M), shape (..., K)"""
+        m = np.asarray(m)
+        if m.shape[-2:] != tuple(self.shape):
+            raise ValueError("shape mismatch %s, %s" % (m.shape,
+                                                       self.shape))
+        batch = m.shape[:-2]
+        n = int(np.prod(batch))
+        if not batch:
+            index = self.index
+        else:
+            index = (self.index + self.bins*np.arange(n)[:, None]).ravel()
+        r = np.bincount(index, m.ravel(), n*self.bins)
+        return self._fold(r.reshape(batch + (self.bins,)))
+
+    def mean(self, m):
+        """Binned averages of `m` (nan for empty bins)"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.sum(m)/self.counts
+
+    def cumsum(self, m):
+        """Cumulative binned sums of `m`: the encircled ("azimuthal")
+        or ensquared ("square") energy within the upper bin edges"""
+        return np.cumsum(self.sum(m), axis=-1)
+
+
+@clru_cache(maxsize=16)
+def polar_binning(shape, center, direction="azimuthal", aspect=1.,
+                  binsize=None):
+    """Cached `PolarBinning` (arguments need to be hashable)"""
+    return PolarBinning(shape, center, direction, aspect, binsize)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+#   rayopt - raytracing for optical imaging systems
+#   Copyright (C) 2014 Robert Jordens <jordens@phys.ethz.ch>
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import (absolute_import, print_function,
+                        unicode_literals, division)
+
+import itertools
+
+import numpy as np
+
+__all__ = ["StampMixin"]
+
+
+_stamps = itertools.count(1)
+
+
+def _same(a, b):
+    if a is b:
+        return True
+    try:
+        return np.shape(a) == np.shape(b) and bool(np.all(a == b))
+    except (TypeError, ValueError):
+        return False
+
+
+class StampMixin(object):
+    """Records a globally increasing modification stamp whenever an
+    attribute is assigned a different value. In-place changes (e.g. of
+    list items) need an explicit `touch()`."""
+    _stamp = 0
+
+    def __setattr__(self, name, value):
+        if isinstance(getattr(type(self), name, None), property):
+            # the setter assigns the underlying attributes
+            super(StampMixin, self).__setattr__(name, value)
+            return
+        changed = (name not in self.__dict__ or
+                   not _same(self.__dict__[name], value))
+        super(StampMixin, self).__setattr__(name, value)
+        if changed:
+            self.touch()
+
+    def touch(self):
+        object.__setattr__(self, "_stamp", next(_stamps))
+
+    @property
+    def stamp(self):
+        return self._stamp
@@ -20,6 +20,7 @@ from __future__ import (absolute_import, print_function,
                         unicode_literals, division)
 
 import itertools
+import json
 
 import numpy as np
 from scipy.optimize import newton, brentq
@@ -39,12 +40,14 @@ class System(list):
     def __init__(self, elements=None, description="", scale=1e-3,
                  wavelengths=None, stop=1, fields=None,
                  object=None, image=None,
-                 pickups=None, validators=None, solves=None):
+                 pickups=None, validators=None, solves=None,
+                 spectral_weights=None):
         elements = [Element.make(_) for _ in elements or []]
         super(System, self).__init__(elements)
         self.description = description
         self.scale = scale
         self.wavelengths = wavelengths or [fraunhofer[i] for i in "dCF"]
+        self.spectral_weights = spectral_weights
         self.stop = stop
         if object:
             self.object = Conjugate.make(object)
@@ -68,10 +71,13 @@ class System(list):
         self.validators = validators or []
         self.solves = solves or []
         self._pupil_cache = {}
+        self._index_table = None
+        self._geometry = None
+        self._paraxial_products = {}
         self.paraxial = ParaxialTrace(self, update=False)
 
     def dict(self):
-        return {
+        dat = {
             "description": self.description,
             "stop": self.stop,
             "scale": float(self.scale),
@@ -83,6 +89,56 @@ class System(list):
             "solves": [dict(s) for s in self.solves],
             "elements": [e.dict() for e in self],
         }
+        if self.spectral_weights is not None:
+            dat["spectral_weights"] = [float(w)
+                                       for w in self.spectral_weights]
+        return dat
+
+    def spectrum(self):
+        """Wavelengths and their normalized spectral weights (equal
+        if `spectral_weights` is None)"""
+        l = np.array(self.wavelengths, dtype=np.float64)
+        if self.spectral_weights is None:
+            w = np.ones_like(l)
+        else:
+            w = np.array(self.spectral_weights, dtype=np.float64)
+            assert w.shape == l.shape, (w, l)
+        return l, w/w.sum()
+
+    def set_band(self, lmin, lmax, n=31, weight=None):
+        """Sample the band `lmin` to `lmax` with `n` wavelengths
+        weighted by `weight(wavelength)` (flat if None). The wavelength
+        closest to the weighted mean becomes the primary one."""
+        l = np.linspace(lmin, lmax, n)
+        w = np.ones(n) if weight is None else weight(l)*np.ones(n)
+        i = np.argmin(np.fabs(l - (l*w).sum()/w.sum()))
+        order = np.r_[i, np.arange(i), np.arange(i + 1, n)]
+        self.wavelengths = [float(_) for _ in l[order]]
+        self.spectral_weights = [float(_) for _ in w[order]]
+
+    def fingerprint(self):
+        """Key of the optical prescription: the element stamps
+        (including the materials), the stop, the wavelengths and the
+        object conjugate."""
+        o = json.dumps(self.object.dict(), sort_keys=True,
+                       default=lambda o: np.asarray(o).tolist())
+        return (tuple(self.stamps()), self.stop, tuple(self.wavelengths),
+                o)
+
+    def stamps(self):
+        """Modification stamps of the elements (including their
+        materials)."""
+        return [e.stamp for e in self]
+
+    def first_change(self, stamps):
+        """Index of the first element that changed since `stamps` were
+        taken, 0 if elements were added or removed, None if there were
+        no changes."""
+        if stamps is None or len(stamps) != len(self):
+            return 0
+        for i, (a, e) in enumerate(zip(stamps, self)):
+            if a != e.stamp:
+                return i
 
     @property
     def aperture(self):
@@ -123,7 +179,9 @@ class System(list):
 
     def set_path(self, path, value):
         v = self
+        owners = []
         for k in path[:-1]:
+            owners.append(v)
             if isinstance(k, str):
                 v = getattr(v, k)
             else:
@@ -133,6 +191,11 @@ class System(list):
             setattr(v, k, value)
         else:
             v[k] = value
+            # in-place change, mark the closest owner as modified
+            for o in reversed(owners):
+                if hasattr(o, "touch"):
+                    o.touch()
+                    break
 
     def pickup(self):
         for pickup in self.pickups:
@@ -201,8 +264,28 @@ class System(list):
                 pass
         return 1.
 
+    def refractive_indices(self, wavelengths=None):
+        """Table (len(self), len(wavelengths)) of the refractive index
+        after each element (as `refractive_index()`) at `wavelengths`
+        (default: the system wavelengths). The last table is kept until
+        an element or material changes."""
+        if wavelengths is None:
+            wavelengths = self.wavelengths
+        l = np.ravel(wavelengths).astype(np.float64)
+        key = tuple(l), self.stamps()
+        if self._index_table is not None and self._index_table[0] == key:
+            return self._index_table[1]
+        n = np.ones((len(self), l.size))
+        for j, element in enumerate(self):
+            try:
+                n[j] = element.refractive_index(l)
+            except AttributeError:
+                if j:
+                    n[j] = n[j - 1]
+        self._index_table = key, n
+        return n
+
     def update(self):
-        self._pupil_cache.clear()
         self.pickup()
         self.solve()
         self.object.pupil.refractive_index = \
@@ -407,15 +490,36 @@ class System(list):
             yield n, m
 
     def paraxial_matrix(self, l, start=1, stop=None):
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if start >= 1:
+            return self.paraxial_products(l).matrix(start, stop)
         n = 1.
         m = np.eye(4)
         for n, mi in self.paraxial_matrices(l, start, stop):
             m = np.dot(mi, m)
         return n, m
 
+    def paraxial_products(self, l):
+        """The `ParaxialProducts` at wavelength `l`, brought up to date
+        with the elements that changed since the last call."""
+        try:
+            p = self._paraxial_products[l]
+        except KeyError:
+            p = self._paraxial_products[l] = ParaxialProducts(l)
+        p.update(self)
+        return p
+
+    def geometry(self):
+        """The `SystemGeometry` of the elements. It is kept until an
+        element (or material) changes."""
+        key = tuple(self.stamps())
+        if self._geometry is None or self._geometry[0] != key:
+            self._geometry = key, SystemGeometry(self)
+        return self._geometry[1]
+
     @property
     def origins(self):
-        return np.cumsum([el.offset for el in self], axis=0)
+        return self.geometry().origins
 
     def close(self, index=-1):
         """close of the system such that image is at object using
@@ -424,11 +528,11 @@ class System(list):
 
     @property
     def path(self):
-        return np.cumsum([el.distance for el in self])
+        return self.geometry().path
 
     @property
     def track(self):
-        return self.origins[:, 2]
+        return self.geometry().track
 
     def align(self, n):
         n0 = n[0]
@@ -440,11 +544,18 @@ class System(list):
 
     @property
     def mirrored(self):
-        return np.cumprod([-1 if getattr(getattr(el, "material", None),
-                                         "mirror", False) else 1
-                           for el in self])
+        return self.geometry().mirrored
 
     def propagate_paraxial(self, yu, n, l, start=1, stop=None):
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if start >= 1:
+            # the element matrices are cached for the system's indices
+            p = self.paraxial_products(l)
+            if np.all(n == p.n[start - 1]):
+                for j in range(start, stop):
+                    yu = np.dot(p.matrices[j], yu)
+                    yield yu, p.n[j]
+                return
         for e in self[start:stop]:
             yu, n = e.propagate_paraxial(yu, n, l)
             yield yu, n
@@ -460,11 +571,92 @@ class System(list):
             yield state
 
     def propagate(self, y, u, n, l, start=1, stop=None, clip=False):
-        for e in self[start:stop]:
-            y, i = e.to_normal(y - e.offset, u)
-            y, u, n, t = e.propagate(y, i, n, l, clip)
+        g = self.geometry()
+        start, stop, _ = slice(start, stop).indices(len(self))
+        # rays are carried in the normal coordinates of the last element
+        y, u = self[start - 1].to_normal(y, u)
+        for j in range(start, stop):
+            if g.transferred[j]:
+                y, u = np.dot(y, g.transfers[j]), np.dot(u, g.transfers[j])
+            y, i = y + g.shifts[j], u
+            y, u, n, t = self[j].propagate(y, i, n, l, clip)
             yield y, u, n, i, t
-            y, u = e.from_normal(y, u)
+
+    def propagate_into(self, y, u, n, i, t, l, start=1, stop=None,
+                       clip=False, rows=None, callback=None):
+        """In-place variant of `propagate()`.
+
+        Starts from the rays `y[start - 1], u[start - 1]` (in the normal
+        coordinates of element `start - 1`) and writes intercepts,
+        excidence and incidence directions, refractive indices and
+        optical path lengths directly into the rows of `y, u, i, n, t`
+        (as in `GeometricTrace`). Between elements the rays are moved
+        with the fused transfer rotations and shifts of `geometry()`;
+        the rotation is skipped where neither element is rotated.
+
+        If given, `rows[j]` is the row that element `j` is stored in;
+        elements with negative rows are only traced through scratch
+        arrays and their optical path lengths are added to the next
+        stored row. Arrays that are not float64 are filled from float64
+        scratch arrays. `callback(j, y, u, i, n, t)` is called with
+        the rows of each element after it has been traced.
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if rows is None:
+            rows = range(len(self))
+        init = rows[start - 1]
+        assert init >= 0, (start, rows)
+        g = self.geometry()
+        direct = y.dtype == u.dtype == i.dtype == t.dtype == np.float64
+        # rays are carried in the normal coordinates of the last element
+        # and transformed to the next with the fused transfer (only if
+        # either is rotated) and shift
+        scratch = [None, None]
+        if direct:
+            yp, up, sp = y[init], u[init], None
+        else:
+            scratch[0] = (np.empty(y[init].shape), np.empty(u[init].shape),
+                          np.empty(i[init].shape), np.empty(t[init].shape))
+            yp, up, sp = scratch[0][0], scratch[0][1], 0
+            yp[...], up[...] = y[init], u[init]
+        opl = None
+        n0 = n[init]
+        for j in range(start, stop):
+            e, r = self[j], rows[j]
+            if r >= 0 and direct:
+                yj, uj, ij, tj = y[r], u[r], i[r], t[r]
+                sj = None
+            else:
+                # alternate the two scratch sets, never the one of yp
+                sj = 1 if sp == 0 else 0
+                if scratch[sj] is None:
+                    scratch[sj] = (np.empty(y[init].shape),
+                                   np.empty(u[init].shape),
+                                   np.empty(i[init].shape),
+                                   np.empty(t[init].shape))
+                yj, uj, ij, tj = scratch[sj]
+            if g.transferred[j]:
+                np.dot(yp, g.transfers[j], out=yj)
+                np.dot(up, g.transfers[j], out=ij)
+                yj += g.shifts[j]
+            else:
+                np.add(yp, g.shifts[j], out=yj)
+                ij[...] = up
+            n0 = e.propagate(yj, ij, n0, l, clip, out=(yj, uj, tj))[2]
+            if callback is not None:
+                callback(j, yj, uj, ij, n0, tj)
+            yp, up, sp = yj, uj, sj
+            if r < 0:
+                if opl is None:
+                    opl = np.zeros_like(tj)
+                opl += tj
+                continue
+            n[r] = n0
+            if not direct:
+                y[r], u[r], i[r], t[r] = yj, uj, ij, tj
+            if opl is not None:
+                t[r] += opl
+                opl = None
 
     def solve_newton(self, merit, a=0., tol=1e-3, maxiter=30):
         def find_start(fun, a0):
@@ -504,6 +696,105 @@ class System(list):
         a = brentq(merit, a, b, rtol=tol, xtol=tol, maxiter=maxiter)
         return a
 
+    def solve_secant(self, merit, a, tol=1e-10, maxiter=30):
+        """Vectorized `solve_newton()`: find the roots of the elementwise
+        `merit(a)` for all elements of `a` at once with secant steps.
+
+        The tolerance is tight so that the roots do not depend on the
+        starting points (e.g. cached guesses)."""
+        a = np.array(a, dtype=np.float64)
+        f = merit(a)
+        # find starting points
+        for scale in np.arange(1, maxiter):
+            bad = np.isnan(f)
+            if not np.any(bad):
+                break
+            for ai in -scale, scale:
+                ab = np.where(bad, a + ai, a)
+                fb = merit(ab)
+                good = bad & ~np.isnan(fb)
+                a = np.where(good, ab, a)
+                f = np.where(good, fb, f)
+                bad &= ~good
+        if np.any(np.isnan(f)):
+            raise ValueError("no starting ray found")
+        # same first step as scipy.optimize.newton
+        a0, f0 = a, f
+        a = a0*(1 + 1e-4) + np.where(a0 >= 0, 1e-4, -1e-4)
+        active = np.fabs(f0) > tol
+        a = np.where(active, a, a0)
+        f = merit(a)
+        for i in range(maxiter):
+            bad = active & ~np.isfinite(f)
+            if np.any(bad):
+                raise ValueError("non-finite iterate", a[bad])
+            if not np.any(active):
+                return a
+            df = f - f0
+            with np.errstate(divide="ignore", invalid="ignore"):
+                da = np.where(df == 0, 0, -f*(a - a0)/df)
+            a0, f0 = a, f
+            a = np.where(active, a + da, a)
+            active &= np.fabs(da) > tol*(1 + np.fabs(a))
+            f = merit(a)
+        raise ValueError("failed to converge", a[active])
+
+    def solve_bracket(self, merit, b, tol=1e-10, maxiter=50):
+        """Vectorized `solve_brentq()`: find the roots of the elementwise
+        `merit(a*b)` between `a=0` and `a=b=1` (expanding `b` as in
+        `solve_brentq()`), using Illinois false position steps. Returns
+        `a*b`.
+
+        The merit function takes the absolute values (as `b`-shaped array)
+        and must be negative at zero. As in `solve_secant()` the tolerance
+        is tight.
+        """
+        b = np.array(b, dtype=np.float64)
+        a = np.zeros_like(b)
+        fb = merit(b)
+        # expand or shrink the bracket
+        open_ = np.ones(b.shape, bool)
+        for i in range(maxiter):
+            done = np.fabs(fb) <= tol
+            nan = np.isnan(fb)
+            neg = ~done & ~nan & (fb < 0)
+            open_ &= ~done & (nan | neg)
+            if not np.any(open_):
+                break
+            a = np.where(open_ & neg, b, a)
+            b = np.where(open_ & nan, b/2,
+                         np.where(open_ & neg, b*(1 - fb), b))
+            fb = np.where(open_, merit(b), fb)
+        else:
+            raise ValueError("no viable interval found", a[open_],
+                             b[open_], fb[open_])
+        active = np.fabs(fb) > tol
+        fa = merit(a)
+        if not np.all(fa[active] < 0):
+            raise ValueError("no viable interval found", a, fa)
+        active &= np.fabs(fa) > tol
+        x = np.where(np.fabs(fa) <= tol, a, b)
+        side = np.zeros(b.shape, int)
+        for i in range(maxiter):
+            if not np.any(active):
+                return x
+            with np.errstate(divide="ignore", invalid="ignore"):
+                x = np.where(active, (a*fb - b*fa)/(fb - fa), x)
+            fx = merit(x)
+            bad = active & ~np.isfinite(fx)
+            if np.any(bad):
+                raise ValueError("non-finite iterate", x[bad])
+            left = fx < 0
+            # Illinois: halve the value at the end point that is retained
+            fa = np.where(left, fx, np.where(side == -1, fa/2, fa))
+            fb = np.where(left, np.where(side == 1, fb/2, fb), fx)
+            a = np.where(active & left, x, a)
+            b = np.where(active & ~left, x, b)
+            side = np.where(left, 1, -1)
+            active &= ((np.fabs(fx) > tol) &
+                       (b - a > tol*(1 + np.fabs(x))))
+        raise ValueError("failed to converge", x[active])
+
     def aim(self, *args, **kwargs):
         return self.object.aim(*args, surface=self[0], **kwargs)
 
@@ -557,33 +848,102 @@ class System(list):
         assert a
         return a*p
 
-    def _aim_pupil(self, xo, yo, guess, **kwargs):
-        y = np.array((xo, yo))
-        if guess is None:
-            if not self.object.finite and self.object.wideangle and False:
-                # FIXME: wideangle!
-                z = self.object.entrance_distance
+    def aim_chiefs(self, yo, z, p, l=None, stop=None, **kwargs):
+        """Vectorized `aim_chief()` for the field points `yo` (n, 2)
+        with pupil distances `z` and apertures `p` (n,)."""
+        yo = np.atleast_2d(yo)
+        z = z*np.ones(yo.shape[0])
+        if self.object.pupil.telecentric or not self.object.pupil.aim:
+            return z
+        if l is None:
+            l = self.wavelengths[0]
+        n = self.refractive_index(l, 0)
+        if stop in (-1, None):
+            stop = self.stop
+        rad = self[self.stop].radius
+        assert rad
+
+        def dist(a):
+            y, u = self.aim(yo, None, z + a*p, filter=False)
+            for yunit in self.propagate(y, u, n, l, stop=stop + 1):
+                y = yunit[0]
+            return (yo*y[:, :2]).sum(1)/rad
+        a = self.solve_secant(dist, np.zeros_like(z), **kwargs)
+        return z + a*p
+
+    def aim_marginals(self, yo, yp, z, p, l=None, stop=None, **kwargs):
+        """Vectorized `aim_marginal()` for the field points `yo` (n, 2)
+        with pupil distances `z` and apertures `p` (n,)."""
+        yo = np.atleast_2d(yo)
+        p = p*np.ones(yo.shape[0])
+        rim = stop == -1
+        if not self.object.pupil.aim and not rim:
+            return p
+        if l is None:
+            l = self.wavelengths[0]
+        n = self.refractive_index(l, 0)
+        if rim:
+            stop = len(self) - 1
+        elif stop is None:
+            stop = self.stop + 1
+        r2 = np.square([e.radius for e in self[1:stop]])
+
+        def dist(a):
+            y, u = self.aim(yo, yp, z, a*p, filter=False)
+            ys = []
+            for yunit in self.propagate(y, u, n, l, stop=stop):
+                ys.append(yunit[0])
+            d = np.square(ys)[:, :, :2].sum(2)/r2[:, None] - 1
+            if rim:
+                return d.max(0)
             else:
-                z = self.object.pupil.distance
-            a = self.object.pupil.radius
-            a = a*np.ones((2, 2))
-        else:
-            z, a = guess[0], guess[1:].reshape(2, 2)
-        if not np.allclose(y, 0):
-            z1 = self.aim_chief(y, z, np.fabs(a).max(), **kwargs)
+                return d[-1]
+        a = self.solve_bracket(dist, np.ones_like(p), **kwargs)
+        assert np.all(a)
+        return a*p
+
+    def _aim_pupils(self, xo, yo, guess=None, **kwargs):
+        """Vectorized `_aim_pupil()`. Rows of `guess` that contain
+        NaN are started cold."""
+        y = np.c_[xo, yo]
+        m = y.shape[0]
+        z = self.object.pupil.distance*np.ones(m)
+        a = self.object.pupil.radius*np.ones((m, 2, 2))
+        cold = np.ones(m, bool)
+        if guess is not None:
+            cold = np.any(np.isnan(guess), axis=1)
+            z = np.where(cold, z, guess[:, 0])
+            a = np.where(cold[:, None, None], a,
+                         guess[:, 1:].reshape(m, 2, 2))
+        off = ~np.all(np.isclose(y, 0), axis=1)
+        if np.any(off):
+            z1 = self.aim_chiefs(y[off], z[off],
+                                 np.fabs(a[off]).max(axis=(1, 2)), **kwargs)
             if self.object.finite:
-                a *= np.fabs(z1/z)  # improve guess
-            z = z1
+                a[off] *= np.fabs(z1/z[off])[:, None, None]
+            z[off] = z1
+        # fields on the y axis are symmetric in x
+        meridional = y[:, 0] == 0
         for ax, sig in (1, 1), (1, 0), (0, 1), (0, 0):
             yp = [0, 0]
             yp[ax] = 2*sig - 1.
-            a1 = self.aim_marginal(y, yp, z, a[sig, ax], **kwargs)
-            a[sig, ax] = a1
-            if sig == 1:  # and guess is None
-                a[0, ax] = -a[1, ax]
-            if (sig, ax) == (1, 1) and guess is None:
-                a[:, 0] = a[:, 1]
-        return np.r_[z, a.flat]
+            i = slice(None)
+            if (sig, ax) == (0, 0):
+                i = ~meridional
+                if not np.any(i):
+                    break
+            a[i, sig, ax] = self.aim_marginals(y[i], yp, z[i],
+                                               a[i, sig, ax], **kwargs)
+            if sig == 1:
+                a[:, 0, ax] = -a[:, 1, ax]
+            if (sig, ax) == (1, 1):
+                a[cold, :, 0] = a[cold, :, 1]
+        return np.c_[z, a.reshape(m, 4)]
+
+    def _aim_pupil(self, xo, yo, guess, **kwargs):
+        if guess is not None:
+            guess = np.asarray(guess)[None]
+        return self._aim_pupils([xo], [yo], guess, **kwargs)[0]
 
     def pupil(self, yo, l=None, stop=None, **kwargs):
         k = l, stop
@@ -592,5 +952,145 @@ class System(list):
         except KeyError:
             c = self._pupil_cache[k] = PolarCacheND(self._aim_pupil,
                                                     l=l, stop=stop, **kwargs)
+        c.rekey(self.fingerprint())
         q = c(*yo)
         return q[0], q[1:].reshape(2, 2)
+
+    def pupils(self, yo, l=None, stop=None, **kwargs):
+        """Pupil distances (n,) and apertures (n, 2, 2) for the field
+        points `yo` (n, 2), aiming all uncached points at once."""
+        yo = np.atleast_2d(yo)
+        k = l, stop
+        try:
+            c = self._pupil_cache[k]
+        except KeyError:
+            c = self._pupil_cache[k] = PolarCacheND(self._aim_pupil,
+                                                    l=l, stop=stop, **kwargs)
+        c.rekey(self.fingerprint())
+        keys = [tuple(_) for _ in yo]
+        new = sorted(set(_ for _ in keys if _ not in c.cache))
+        if new:
+            guess = np.array([c.guesses.pop(_, [np.nan]*5) for _ in new])
+            try:
+                q = self._aim_pupils(*np.array(new).T, guess=guess,
+                                     l=l, stop=stop, **kwargs)
+            except (ValueError, AssertionError, RuntimeError):
+                if np.all(np.isnan(guess)):
+                    raise
+                # stale guesses too far off, start over
+                q = self._aim_pupils(*np.array(new).T,
+                                     l=l, stop=stop, **kwargs)
+            c.cache.update(zip(new, q))
+            c._update()
+        q = np.array([c.cache[_] for _ in keys])
+        return q[:, 0], q[:, 1:].reshape(-1, 2, 2)
+
+
+@public
+class SystemGeometry(object):
+    """Stacked geometry of the elements of a system: offsets,
+    origins, path, track, mirror signs, rotations to the element normal
+    coordinates and the composed element to element transforms.
+
+    The arrays are read-only. In row vector convention (as
+    `from_normal()`) normal coordinates of element `j - 1` transform
+    to those of element `j` as `y @ transfers[j] + shifts[j]`
+    (directions without the shift). `rotated[j]` is False where
+    `rotations[j]` is the identity, `transferred[j]` where
+    `transfers[j]` is not.
+    """
+    def __init__(self, system):
+        n = len(system)
+        self.offsets = np.array([e.offset for e in system],
+                                np.float64).reshape(n, 3)
+        self.origins = np.cumsum(self.offsets, axis=0)
+        self.path = np.cumsum([e.distance for e in system])
+        self.track = self.origins[:, 2]
+        self.mirrored = np.cumprod([
+            -1 if getattr(getattr(e, "material", None), "mirror", False)
+            else 1 for e in system])
+        self.rotated = np.array([e.rotated for e in system], bool)
+        self.rotations = np.array([e.rot_normal if e.rotated else np.eye(3)
+                                   for e in system]).reshape(n, 3, 3)
+        rt = self.rotations.transpose(0, 2, 1)
+        self.transfers = np.empty_like(self.rotations)
+        self.transfers[:1] = np.eye(3)
+        self.transfers[1:] = np.matmul(self.rotations[:-1], rt[1:])
+        self.transferred = np.r_[False, self.rotated[:-1] | self.rotated[1:]]
+        self.shifts = -np.matmul(self.offsets[:, None, :], rt)[:, 0]
+        for a in (self.offsets, self.origins, self.path, self.track,
+                  self.mirrored, self.rotated, self.rotations,
+                  self.transfers, self.transferred, self.shifts):
+            a.setflags(write=False)
+
+
+@public
+class ParaxialProducts(object):
+    """Paraxial matrices of the elements at wavelength `l`, the
+    refractive indices after them and their cumulative products:
+    `prefix[k]` is the product of the matrices of elements `1...k`
+    (`prefix[0]` the identity), `suffix[k]` that of elements `k...`
+    (`suffix[len(system)]` the identity).
+
+    `update()` only recomputes the matrices of the elements that
+    changed (or whose incident index changed), the prefixes after the
+    first and the suffixes before the last of them.
+    """
+    def __init__(self, l):
+        self.l = l
+        self.stamps = None
+
+    def update(self, system):
+        stamps = system.stamps()
+        k = len(stamps)
+        if self.stamps is None or len(self.stamps) != k:
+            self.n = np.ones(k)
+            self.matrices = np.tile(np.eye(4), (k, 1, 1))
+            self.prefix = np.tile(np.eye(4), (k, 1, 1))
+            self.suffix = np.tile(np.eye(4), (k + 1, 1, 1))
+            changed = [True]*k
+        else:
+            changed = [a != b for a, b in zip(self.stamps, stamps)]
+        self.stamps = stamps
+        if not any(changed):
+            return
+        first, last = None, None
+        dirty = changed[0]
+        if dirty:
+            n = system.refractive_index(self.l, 0)
+            dirty = n != self.n[0]
+            self.n[0] = n
+        for j in range(1, k):
+            if not (dirty or changed[j]):
+                continue
+            n, self.matrices[j] = system[j].paraxial_matrix(
+                self.n[j - 1], self.l)
+            dirty = n != self.n[j]
+            self.n[j] = n
+            if first is None:
+                first = j
+            last = j
+        if first is None:
+            return
+        for j in range(first, k):
+            self.prefix[j] = np.dot(self.matrices[j], self.prefix[j - 1])
+        for j in range(last, 0, -1):
+            self.suffix[j] = np.dot(self.suffix[j + 1], self.matrices[j])
+
+    def matrix(self, start=1, stop=None):
+        """Refractive index after and paraxial matrix of the elements
+        `start:stop` (`start >= 1`) as `System.paraxial_matrix()`."""
+        k = len(self.n)
+        start, stop, _ = slice(start, stop).indices(k)
+        assert start >= 1, start
+        if stop <= start:
+            return 1., np.eye(4)
+        n = self.n[stop - 1]
+        if start == 1:
+            return n, self.prefix[stop - 1].copy()
+        if stop == k:
+            return n, self.suffix[start].copy()
+        m = self.matrices[start]
+        for mi in self.matrices[start + 1:stop]:
+            m = np.dot(mi, m)
+        return n, m.copy()
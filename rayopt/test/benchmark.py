@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+#
+#   rayopt - raytracing for optical imaging systems
+#   Copyright (C) 2016 Robert Jordens <jordens@phys.ethz.ch>
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Ray trace benchmarks.
+
+Times the core hot paths on a fixed set of reference systems and
+writes the results to a JSON file so that they can be compared between
+commits.
+
+Run with::
+
+    python -m rayopt.test.benchmark -o benchmark.json
+"""
+
+from __future__ import (absolute_import, print_function,
+                        unicode_literals, division)
+
+import json
+import platform
+import subprocess
+import time
+import timeit
+
+import numpy as np
+
+from rayopt import (system_from_yaml, GeometricTrace, ParaxialTrace,
+                    PolyTrace, Analysis, Library)
+from rayopt.test.systems import systems
+
+
+def best(f, repeat=3):
+    return min(timeit.repeat(f, number=1, repeat=repeat))
+
+
+def propagate_generator(t, start=1, stop=None, clip=False):
+    """The element-by-element `System.propagate()` generator path,
+    copying each yielded tuple into the trace arrays."""
+    init = start - 1
+    y, u, n, l = t.y[init], t.u[init], t.n[init], t.l
+    y, u = t.system[init].from_normal(y, u)
+    for j, yunit in enumerate(t.system.propagate(
+            y, u, n, l, start, stop, clip)):
+        j += start
+        t.y[j], t.u[j], t.n[j], t.i[j], t.t[j] = yunit
+
+
+def propagate_into(t, start=1, stop=None, clip=False):
+    t.system.propagate_into(t.y, t.u, t.n, t.i, t.t, t.l,
+                            start, stop, clip)
+
+
+def bench_propagate(system, nrays=(10, 1000, 100000), repeat=3):
+    t = GeometricTrace(system)
+    for n in nrays:
+        t.rays_point((0, .7), nrays=n, distribution="square")
+        for f in propagate_generator, propagate_into:
+            yield f.__name__, dict(nrays=t.nrays), best(lambda: f(t), repeat)
+
+
+def bench_rays_point(system, nrays=(100, 10000, 100000), repeat=3):
+    t = GeometricTrace(system)
+    for n in nrays:
+        dt = best(lambda: t.rays_point((0, .7), nrays=n,
+                                       distribution="square"), repeat)
+        yield "rays_point", dict(nrays=t.nrays), dt
+
+
+def bench_pupil(system, repeat=3):
+    def cold():
+        system._pupil_cache.clear()
+        system.pupil((0, .7))
+    yield "pupil", dict(cache="cold"), best(cold, repeat)
+    yield "pupil", dict(cache="warm"), best(
+        lambda: system.pupil((0, .7)), repeat)
+
+
+def bench_paraxial(system, repeat=3):
+    p = ParaxialTrace(system)
+    yield "paraxial", {}, best(lambda: p.update(full=True), repeat)
+
+
+def bench_poly(system, kmax=(3, 5, 7), repeat=3):
+    for k in kmax:
+        yield "poly", dict(kmax=k), best(lambda: PolyTrace(system, k),
+                                         repeat)
+
+
+def bench_psf(system, nrays=(100, 1000), repeat=3):
+    t = GeometricTrace(system)
+    for n in nrays:
+        t.rays_point((0, .7), nrays=n, distribution="square", filter=False)
+        yield "psf", dict(nrays=t.nrays), best(t.psf, repeat)
+
+
+def bench_analysis(system, repeat=1):
+    import matplotlib.pyplot as plt
+
+    def run():
+        a = Analysis(system, print=False)
+        for fig in a.figures:
+            plt.close(fig)
+    yield "analysis", {}, best(run, repeat)
+
+
+def bench_library(system, names=("SCHOTT-BK|N-BK7", "SCHOTT-SK|N-SK16",
+                                  "SiO2|Malitson"), repeat=3):
+    lib = Library.one()
+    yield "library", dict(names=len(names)), best(
+        lambda: [lib.get("material", n) for n in names], repeat)
+
+
+benchmarks = [bench_propagate, bench_rays_point, bench_pupil,
+              bench_paraxial, bench_poly, bench_psf, bench_analysis,
+              bench_library]
+
+
+def run_suite(names=None, benches=None, repeat=None, keep_going=False,
+              options={}):
+    """Run the benchmarks on the reference systems and yield result
+    dicts. `repeat` overrides the repetitions of all benchmarks,
+    `options` maps benchmark names to keyword argument overrides.
+    Errors are raised unless `keep_going`, then they are recorded
+    with the results."""
+    kwargs = {} if repeat is None else dict(repeat=repeat)
+    for name, text in systems:
+        if names and name not in names:
+            continue
+        for bench in benchmarks:
+            b = bench.__name__[len("bench_"):]
+            if benches and b not in benches:
+                continue
+            r = dict(system=name, benchmark=b)
+            try:
+                s = system_from_yaml(text)
+                s.update()
+                kw = dict(kwargs, **options.get(b, {}))
+                for label, params, dt in bench(s, **kw):
+                    yield dict(r, name=label, params=params, time=dt)
+            except Exception as e:
+                if not keep_going:
+                    raise
+                yield dict(r, error="%s: %s" % (type(e).__name__, e))
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(commit=commit, time=time.time(),
+                python=platform.python_version(), numpy=np.__version__,
+                machine=platform.machine(), platform=platform.platform())
+
+
+def main():
+    import argparse
+    p = argparse.ArgumentParser(description="rayopt benchmarks")
+    p.add_argument("-o", "--output", default="benchmark.json",
+                   help="JSON results file")
+    p.add_argument("-s", "--system", action="append",
+                   help="reference system(s) to run")
+    p.add_argument("-b", "--benchmark", action="append",
+                   help="benchmark(s) to run")
+    p.add_argument("-k", "--keep-going", action="store_true",
+                   help="record errors and continue")
+    o = p.parse_args()
+    results = []
+    for r in run_suite(o.system, o.benchmark, keep_going=o.keep_going):
+        results.append(r)
+        if "error" in r:
+            print("{system:15s} {benchmark:15s} {error}".format(**r))
+        else:
+            print("{system:15s} {name:20s} {params!s:25s} "
+                  "{time:10.3g} s".format(**r))
+    with open(o.output, "w") as f:
+        json.dump(dict(environment(), results=results), f, indent=1,
+                  sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
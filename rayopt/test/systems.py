@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+#   rayopt - raytracing for optical imaging systems
+#   Copyright (C) 2016 Robert Jordens <jordens@phys.ethz.ch>
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Reference systems of the tests and benchmarks."""
+
+from __future__ import (absolute_import, print_function,
+                        unicode_literals, division)
+
+
+cooke = """
+description: 'oslo cooke triplet example 50mm f/4 20deg'
+wavelengths: [587.56e-9, 656.27e-9, 486.13e-9]
+object: {angle_deg: 20, pupil: {radius: 6.25, aim: True}}
+image: {type: finite, pupil: {radius: 0, update_radius: True}}
+elements:
+- {material: air}
+- {roc: 21.25, distance: 5.0, material: SCHOTT-SK|N-SK16, radius: 6.5}
+- {roc: -158.65, distance: 2.0, material: air, radius: 6.5}
+- {roc: -20.25, distance: 6.0, material: SCHOTT-F|N-F2, radius: 5.0}
+- {roc: 19.6, distance: 1.0, material: air, radius: 5.0}
+- {material: air, radius: 4.75}
+- {roc: 141.25, distance: 6.0, material: SCHOTT-SK|N-SK16, radius: 6.5}
+- {roc: -17.285, distance: 2.0, material: air, radius: 6.5}
+- {distance: 42.95, radius: 0.364}
+stop: 5
+pickups:
+- {get: [1, radius], set: [2, radius]}
+- {get: [3, radius], set: [4, radius]}
+- {get: [6, radius], set: [7, radius]}
+validators:
+- {get: [edge_y, 2], minimum: .5}
+- {get: [2, distance], minimum: .5}
+- {get: [edge_y, 4], minimum: .5}
+- {get: [4, distance], minimum: .5}
+- {get: [edge_y, 7], minimum: .5}
+- {get: [7, distance], minimum: .5}
+"""
+
+double_gauss = """
+description: 'double gauss 100mm f/3 28deg'
+wavelengths: [587.56e-9, 656.27e-9, 486.13e-9]
+object: {angle_deg: 14, pupil: {radius: 16.7, aim: True}}
+image: {type: finite, pupil: {radius: 0, update_radius: True}}
+elements:
+- {material: air}
+- {roc: 54.153, distance: 5, material: 1.607/56.7, radius: 29.2}
+- {roc: 152.522, distance: 8.747, material: air, radius: 28.1}
+- {roc: 35.951, distance: .5, material: 1.620/60.3, radius: 24.3}
+- {distance: 14, material: 1.603/38.0, radius: 21.3}
+- {roc: 22.27, distance: 3.777, material: air, radius: 14.9}
+- {distance: 14.253, material: air, radius: 10.2}
+- {roc: -25.685, distance: 12.428, material: 1.603/38.0, radius: 13.2}
+- {distance: 3.777, material: 1.620/60.3, radius: 16.5}
+- {roc: -36.98, distance: 10.834, material: air, radius: 17.0}
+- {roc: 196.417, distance: .5, material: 1.620/60.3, radius: 18.1}
+- {roc: -67.148, distance: 6.858, material: air, radius: 18.3}
+- {distance: 57.315, radius: 24}
+stop: 6
+"""
+
+mobile = """
+description: 'aspheric mobile phone lens 3.5mm f/2.2 60deg'
+wavelengths: [587.56e-9, 656.27e-9, 486.13e-9]
+object: {angle_deg: 30, pupil: {radius: .8, aim: True}}
+image: {type: finite, pupil: {radius: 0, update_radius: True}}
+elements:
+- {material: air}
+- {roc: 1.6, distance: .3, conic: -0.5, aspherics: [0, -0.01, .005],
+   material: 1.544/56.1, radius: .8}
+- {roc: -12, distance: .6, aspherics: [0, .02], material: air,
+   radius: .85}
+- {roc: -2.5, distance: .4, aspherics: [0, -0.03, .01],
+   material: 1.635/23.9, radius: 1}
+- {roc: -5, distance: .35, aspherics: [0, .01], material: air,
+   radius: 1.2}
+- {roc: 2, distance: .5, conic: -5, aspherics: [0, -0.05, .01],
+   material: 1.544/56.1, radius: 1.6}
+- {roc: 1.5, distance: .4, conic: -4, aspherics: [0, -0.06, .01],
+   material: air, radius: 2}
+- {distance: .8, radius: 2.4}
+stop: 1
+"""
+
+folded = """
+description: 'f/8 newtonian with 45deg fold mirror'
+object: {angle_deg: .5, pupil: {radius: 50}}
+stop: 1
+elements:
+- {material: vacuum}
+- {material: mirror, distance: 10, roc: -1600, radius: 52}
+- {material: mirror, distance: 720, direction: [0, 0, -1],
+   angles: [0.7853981633974483, 0, 0], radius: 25}
+- {material: vacuum, distance: 80, direction: [0, 1, 0], radius: 10}
+"""
+
+systems = [("cooke", cooke), ("double_gauss", double_gauss),
+           ("mobile", mobile), ("folded", folded)]
@@ -21,8 +21,11 @@ from __future__ import (absolute_import, print_function,
 
 import unittest
 
+from numpy import testing as nptest
+
 from rayopt import system_from_yaml, Analysis
-from .test_raytrace import cooke
+from rayopt.analysis import transverse_fans
+from .systems import cooke
 
 
 class DemotripCase(unittest.TestCase):
@@ -37,3 +40,40 @@ class DemotripCase(unittest.TestCase):
             print(_)
         for i, _ in enumerate(a.figures):
             _.savefig("analysis_%i.pdf" % i)
+
+    def test_workers(self):
+        kw = dict(print=False, plot_mtf=True)
+        # analysis refocuses the system, run both on fresh copies
+        a = Analysis(system_from_yaml(cooke), **kw)
+        b = Analysis(system_from_yaml(cooke), workers=2, **kw)
+        self.assertIsNone(b._executor)
+        self.assertEqual(a.text, b.text)
+        self.assertEqual(len(a.figures), len(b.figures))
+        # the workers aim from a cold pupil cache, the serial run from
+        # warm guesses
+        tol = dict(rtol=1e-7, atol=1e-9)
+        for fa, fb in zip(a.figures, b.figures):
+            for aa, ab in zip(fa.axes, fb.axes):
+                self.assertEqual(len(aa.lines), len(ab.lines))
+                for la, lb in zip(aa.lines, ab.lines):
+                    nptest.assert_allclose(la.get_xydata(),
+                                           lb.get_xydata(), **tol)
+                for ia, ib in zip(aa.images, ab.images):
+                    nptest.assert_allclose(ia.get_array(),
+                                           ib.get_array(), **tol)
+
+    def test_map(self):
+        h, w = [0., 1.], self.s.wavelengths
+        a = Analysis(self.s, run=False, print=False)
+        fa = a.map(transverse_fans, h, w, 21)
+        a.start_workers(2)
+        try:
+            fb = a.map(transverse_fans, h, w, 21)
+        finally:
+            a.stop_workers()
+        self.assertEqual(len(fa), len(fb))
+        for ai, bi in zip(fa, fb):
+            for (pa, ya, ra), (pb, yb, rb) in zip(ai, bi):
+                self.assertEqual(ra, rb)
+                nptest.assert_allclose(pa, pb)
+                nptest.assert_allclose(ya, yb)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+#
+#   rayopt - raytracing for optical imaging systems
+#   Copyright (C) 2016 Robert Jordens <jordens@phys.ethz.ch>
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import (absolute_import, print_function,
+                        unicode_literals, division)
+
+import unittest
+
+from rayopt.test.benchmark import run_suite, benchmarks
+
+
+class BenchmarkCase(unittest.TestCase):
+    # a handful of rays, Analysis is covered by test_analysis
+    benches = [b.__name__[len("bench_"):] for b in benchmarks
+               if b.__name__ != "bench_analysis"]
+    options = dict(propagate=dict(nrays=(10,)),
+                   rays_point=dict(nrays=(10,)),
+                   poly=dict(kmax=(3,)),
+                   psf=dict(nrays=(10,)))
+
+    def check(self, name):
+        seen = set()
+        for r in run_suite([name], self.benches, repeat=1,
+                           options=self.options):
+            self.assertEqual(r["system"], name)
+            self.assertGreaterEqual(r["time"], 0)
+            seen.add(r["benchmark"])
+        self.assertEqual(seen, set(self.benches))
+
+    def test_cooke(self):
+        self.check("cooke")
+
+    def test_double_gauss(self):
+        self.check("double_gauss")
+
+    def test_mobile(self):
+        self.check("mobile")
+
+    def test_folded(self):
+        self.check("folded")
@@ -41,3 +41,19 @@ class CacheCase(unittest.TestCase):
         c = LinearCacheND(solver)
         for x in np.random.randn(n, 2):
             nptest.assert_equal(c(*x), x)
+
+    def test_rekey(self):
+        guesses = []
+
+        def solver(a, b, guess):
+            guesses.append(guess)
+            return np.array((a, b))
+        c = LinearCacheND(solver, key=0)
+        c(1., 2.)
+        c.rekey(0)
+        c(1., 2.)
+        self.assertEqual(len(guesses), 1)
+        c.rekey(1)
+        c(1., 2.)
+        self.assertEqual(len(guesses), 2)
+        nptest.assert_equal(guesses[-1], (1., 2.))
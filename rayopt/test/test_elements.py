@@ -25,8 +25,9 @@ import numpy as np
 from numpy import testing as nptest
 
 
-from rayopt import Spheroid, ModelMaterial, mirror
+from rayopt import Spheroid, ModelMaterial, mirror, Interface
 from rayopt.utils import sinarctan, tanarcsin
+from rayopt.elements import spheroid_propagate
 
 
 class TransformCase(unittest.TestCase):
@@ -135,3 +136,93 @@ class ParaxToRealCase(unittest.TestCase):
         nptest.assert_allclose(nr, np_, rtol=e**2, atol=3e-8)
         nptest.assert_allclose(yr[:, :2], yp, rtol=e**2, atol=3e-8)
         nptest.assert_allclose(tanarcsin(ur), up/np_, rtol=e**2, atol=3e-8)
+
+
+def random_rays(n=100):
+    y = np.random.randn(n, 3)*(1, 1, 0) + (0, 0, -1)
+    u = np.random.randn(n, 3)*(.1, .1, 0) + (0, 0, 1)
+    u /= np.sqrt(np.square(u).sum(1))[:, None]
+    return y, u
+
+
+class InterceptCase(unittest.TestCase):
+    def rays(self, n=100):
+        return random_rays(n)
+
+    def test_aspheric_newton(self):
+        y, u = self.rays()
+        s0 = Spheroid(curvature=.1, conic=-.5)
+        s1 = Spheroid(curvature=.1, conic=-.5, aspherics=[0., 0.])
+        nptest.assert_allclose(s1.intercept(y, u), s0.intercept(y, u))
+
+    def test_aspheric_on_surface(self):
+        y, u = self.rays()
+        s = Spheroid(curvature=.05, aspherics=[1e-3, 1e-4])
+        t = s.intercept(y, u)
+        self.assertTrue(np.all(np.isfinite(t)))
+        nptest.assert_allclose(s.surface_sag(y + t[:, None]*u), 0,
+                               atol=1e-9)
+
+    def test_aspheric_nonconverged(self):
+        y, u = self.rays()
+        y[0, :2] = 1e3
+        s = Spheroid(curvature=.05, aspherics=[1e-3, 1e-4])
+        t = s.intercept(y, u)
+        self.assertTrue(np.isnan(t[0]))
+        self.assertTrue(np.all(np.isfinite(t[1:])))
+
+    def test_aspheric_report(self):
+        y, u = self.rays()
+        y[0, :2] = 1e3
+        s = Spheroid(curvature=.05, conic=-.5, aspherics=[1e-4, 1e-6])
+        t, n = s.intercept(y, u, full_output=True)
+        self.assertEqual(n[0], -1)
+        # seeded with the conic intercept
+        self.assertTrue(np.all(n[1:] <= 3))
+        t0 = Interface.intercept(s, y, u, maxiter=20)
+        nptest.assert_allclose(t[1:], t0[1:])
+
+    def test_paraboloid(self):
+        y = np.array([[0, 0, -1.], [1, 0, -1], [0, 2, -1]])
+        u = np.array([[0, 0, 1.]]*3)
+        for a in None, [0.]:
+            s = Spheroid(curvature=.01, conic=-1., aspherics=a)
+            nptest.assert_allclose(s.intercept(y, u),
+                                   [1, 1.005, 1.02])
+
+
+@unittest.skipIf(spheroid_propagate is None, "trace_accel not built")
+class AccelCase(unittest.TestCase):
+    def check(self, s, n0=1.):
+        y, u = random_rays()
+        y[0, :2] = 1e3  # clipped or no intercept
+        ya, ua, na, ta = s.propagate(y, u, n0, 500e-9, clip=True)
+        yb, ub, nb, tb = Interface.propagate(s, y, u, n0, 500e-9,
+                                             clip=True)
+        nptest.assert_allclose(na, nb)
+        for a, b in (ya, yb), (ua, ub), (ta, tb):
+            nptest.assert_array_equal(np.isnan(a), np.isnan(b))
+            nptest.assert_allclose(a, b, atol=1e-12)
+
+    def test_flat(self):
+        self.check(Spheroid(radius=2., material=ModelMaterial(n=1.5)))
+
+    def test_conic(self):
+        self.check(Spheroid(curvature=.1, conic=-.5, radius=2.,
+                            material=ModelMaterial(n=1.5)), n0=1.2)
+
+    def test_asphere(self):
+        self.check(Spheroid(curvature=.05, aspherics=[1e-3, 1e-4],
+                            radius=2., material=ModelMaterial(n=1.5)))
+
+    def test_mirror(self):
+        self.check(Spheroid(curvature=-.1, radius=2., material=mirror))
+
+    def test_paraboloid(self):
+        self.check(Spheroid(curvature=-.1, conic=-1., radius=2.,
+                            material=mirror))
+
+    def test_per_ray_index(self):
+        self.check(Spheroid(curvature=.1, radius=2.,
+                            material=ModelMaterial(n=1.5)),
+                   n0=np.linspace(1, 1.7, 100))
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+#
+#   rayopt - raytracing for optical imaging systems
+#   Copyright (C) 2013 Robert Jordens <jordens@phys.ethz.ch>
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import (absolute_import, print_function,
+                        unicode_literals, division)
+
+import unittest
+
+import numpy as np
+from numpy import testing as nptest
+
+from rayopt import system_from_yaml, GeometricTrace, FFTWorkspace
+from rayopt.utils import pupil_chunks
+from rayopt.geometric_trace import mtf_slices
+from rayopt.test.systems import cooke
+
+
+class TraceCase(unittest.TestCase):
+    def setUp(self):
+        self.s = system_from_yaml(cooke)
+        self.s.update()
+        self.s.paraxial.refocus()
+
+    def test_propagate_into(self):
+        g = GeometricTrace(self.s)
+        g.rays_point((0, .7), nrays=50, distribution="square", clip=True)
+        y, u, i, t = g.y.copy(), g.u.copy(), g.i.copy(), g.t.copy()
+        y0, u0 = self.s[0].from_normal(g.y[0], g.u[0])
+        for j, (yj, uj, nj, ij, tj) in enumerate(self.s.propagate(
+                y0, u0, g.n[0], g.l, clip=True)):
+            nptest.assert_allclose(y[j + 1], yj)
+            nptest.assert_allclose(u[j + 1], uj)
+            nptest.assert_allclose(i[j + 1], ij)
+            nptest.assert_allclose(t[j + 1], tj)
+            nptest.assert_allclose(g.n[j + 1], nj)
+
+    def check_batch(self, yo, nrays, **kwargs):
+        g = GeometricTrace(self.s)
+        g.rays_batch(yo, nrays=nrays, **kwargs)
+        ts = g.split()
+        self.assertEqual(len(ts), len(yo)*len(self.s.wavelengths))
+        for (yi, l, s, ref), t in zip(g.batch, ts):
+            r = GeometricTrace(self.s)
+            r.rays_point(yi, l, nrays=nrays, **kwargs)
+            self.assertEqual(r.ref, t.ref)
+            for a in "y t n w".split():
+                nptest.assert_allclose(getattr(r, a), getattr(t, a))
+            nptest.assert_allclose(r.rms(), t.rms())
+        return ts
+
+    def test_batch(self):
+        self.check_batch([(0, 0), (0, .7)], 7, clip=True)
+
+    def test_batch_vignetted(self):
+        # the full field drops rays of the radau quadrature
+        ts = self.check_batch([(0, .7), (0, 1.)], 13,
+                              distribution="radau")
+        self.assertLess(ts[-1].nrays, 13)
+
+    def test_jacobian(self):
+        self.s[3].conic = -.3
+        self.s[6].aspherics = [1e-5, 1e-7]
+        self.s.update()
+        g = GeometricTrace(self.s)
+        g.rays_point((0, .7), nrays=13, distribution="radau")
+        y0, u0 = g.y[0].copy(), g.u[0].copy()
+        params = [(1, "curvature"), (3, "conic"), (4, "distance"),
+                  (6, "curvature"), (-1, "distance")]
+        dy, du, dt = g.jacobian(params)
+        for p, dyi, dui, dti in zip(params, dy, du, dt):
+            v, h = getattr(self.s[p[0]], p[1]), 1e-6
+            r = []
+            for vi in v + h, v - h:
+                setattr(self.s[p[0]], p[1], vi)
+                g.rays_given(y0, u0)
+                g.propagate()
+                r.append((g.y.copy(), g.u.copy(), g.t.copy()))
+            setattr(self.s[p[0]], p[1], v)
+            for a, b, d in zip(r[0], r[1], (dyi, dui, dti)):
+                nptest.assert_allclose((a - b)/(2*h), d, atol=1e-6)
+
+    def test_lean(self):
+        g = GeometricTrace(self.s)
+        g.rays_point((0, .7), nrays=200, distribution="square",
+                     filter=False)
+        seen = []
+        h = GeometricTrace(self.s, surfaces=[5], dtype=np.float32,
+                           callback=lambda j, *a: seen.append(j))
+        h.rays_point((0, .7), nrays=200, distribution="square",
+                     filter=False)
+        self.assertEqual(seen[-8:], list(range(1, 9)))
+        self.assertEqual(h.y.dtype, np.float32)
+        nptest.assert_equal(h.rows, [0, -1, -1, -1, -1, 1, -1, 2, 3])
+        nptest.assert_allclose(h.y, g.y[[0, 5, 7, 8]], atol=1e-5)
+        nptest.assert_allclose(h.t.sum(0), g.t.sum(0), rtol=1e-6)
+        nptest.assert_allclose(h.psf()[-1], g.psf()[-1], atol=1e-4)
+        self.s[2].distance += .01
+        g.update()
+        h.update()
+        nptest.assert_allclose(h.y, g.y[[0, 5, 7, 8]], atol=1e-5)
+
+    def test_lean_full_only(self):
+        h = GeometricTrace(self.s, surfaces=[5])
+        h.rays_point((0, .7), nrays=20, distribution="square")
+        r = [e.radius for e in self.s]
+        self.assertRaises(ValueError, h.resize)
+        self.assertEqual([e.radius for e in self.s], r)
+        self.assertRaises(ValueError, h.plot, None)
+        self.assertRaises(ValueError, list, h.print_trace())
+        self.assertRaises(ValueError, h.jacobian, [(1, "curvature")])
+
+
+class SpotStatisticsCase(unittest.TestCase):
+    def setUp(self):
+        self.s = system_from_yaml(cooke)
+        self.s.update()
+        self.s.paraxial.refocus()
+
+    def test_stream(self):
+        g = GeometricTrace(self.s)
+        g.rays_point((0, .7), nrays=1000, distribution="square")
+        h = GeometricTrace(self.s)
+        st = h.rays_stream((0, .7), pupil_chunks("square", 1000, 200))
+        self.assertEqual(st.n, g.y.shape[1])
+        self.assertLessEqual(h.y.shape[1], 201)
+        nptest.assert_allclose(st.centroid, g.y[-1, :, :2].mean(0),
+                               atol=1e-12)
+        nptest.assert_allclose(st.rms, g.rms())
+        nptest.assert_allclose(st.rms_opd,
+                               np.nanstd(g.opd(resample=False)[2]))
+        r, e = st.encircled()
+        self.assertTrue(np.all(np.diff(e) >= 0))
+        nptest.assert_allclose(e[-1], 1)
+        d = self.s[-1].distance
+        g.refocus()
+        nptest.assert_allclose(self.s[-1].distance - d, st.focus)
+
+    def test_stream_overflow(self):
+        xy, w = next(pupil_chunks("square", 400, 1000))
+        h = GeometricTrace(self.s)
+        # the first chunk sets rmax, the later one is much wider
+        st = h.rays_stream((0, .7), [(xy*.05, w), (xy, w)], opd=False)
+        self.assertGreater(st.overflow, 0)
+        r, e = st.encircled()
+        self.assertTrue(np.all(np.diff(r) > 0))
+        self.assertTrue(np.all(np.diff(e) >= 0))
+        nptest.assert_allclose(e[-1], 1)
+
+
+class PsfCase(unittest.TestCase):
+    def setUp(self):
+        self.s = system_from_yaml(cooke)
+        self.s.update()
+        self.s.paraxial.refocus()
+
+    def test_rays_grid(self):
+        g = GeometricTrace(self.s)
+        g.rays_point((0, .7), nrays=1000, distribution="square")
+        x0, y0, o0 = g.opd()
+        p0, q0, psf0 = g.psf()
+        ws = FFTWorkspace()
+        g.rays_grid((0, .7), n=o0.shape[0])
+        x, y, o = g.opd()
+        self.assertEqual(o.shape, o0.shape)
+        nptest.assert_allclose(np.nanstd(o), np.nanstd(o0), rtol=.1)
+        p, q, psf = g.psf(workspace=ws)
+        nptest.assert_allclose(psf.sum(), 1)
+        nptest.assert_allclose(psf.max(), psf0.max(), rtol=.2)
+        nptest.assert_allclose(np.fabs(p).max(), np.fabs(p0).max(),
+                               rtol=.05)
+        self.assertEqual(len(ws.buffers), 1)
+        g.rays_grid((0, 0), n=o0.shape[0])
+        g.psf(workspace=ws)
+        self.assertEqual(len(ws.buffers), 1)
+
+    def test_psf_polychromatic(self):
+        g = GeometricTrace(self.s)
+        l = self.s.wavelengths[0]
+        g.rays_point((0, .7), l, nrays=300, distribution="square")
+        p0, q0, psf0 = map(np.fft.fftshift, g.psf())
+        p, q, psf = g.psf_polychromatic((0, .7), [l], nrays=300)
+        nptest.assert_allclose(p, p0)
+        nptest.assert_allclose(psf, psf0, atol=1e-12)
+        self.s.set_band(450e-9, 650e-9, 7)
+        p, q, psf = g.psf_polychromatic((0, .7), nrays=300)
+        nptest.assert_allclose(psf.sum(), 1, rtol=.05)
+        g.rays_spectrum((0, .7), nrays=30, distribution="square")
+        self.assertEqual(len(g.batch), 7)
+        nptest.assert_allclose(g.w.sum(), 1)
+
+    def test_psf_direct(self):
+        g = GeometricTrace(self.s)
+        g.rays_point((0, .7), nrays=400, distribution="square")
+        p0, q0, psf0 = map(np.fft.fftshift, g.psf())
+        p, q, psf = g.psf(window=-p0[0, 0], n=p0.shape[0])
+        nptest.assert_allclose(p, p0)
+        nptest.assert_allclose(psf, psf0, atol=2e-5)
+        r = []
+        for d, n in ("square", 1000), ("radau", 100):
+            g.rays_point((0, 0), nrays=n, distribution=d)
+            p, q, psf = g.psf(resample=False, window=.01, n=41)
+            self.assertEqual(psf.shape, (41, 41))
+            r.append(psf)
+        nptest.assert_allclose(r[0].sum(), r[1].sum(), rtol=.05)
+        nptest.assert_allclose(r[0].max(), r[1].max(), rtol=.2)
+
+    def test_mtf(self):
+        g = GeometricTrace(self.s)
+        g.rays_grid((0, .7), n=32)
+        fp, fq, m = g.mtf()
+        self.assertEqual(m.shape, (128, 65))
+        nptest.assert_allclose(m[0, 0], 1)
+        self.assertTrue(np.all(m <= 1 + 1e-9))
+        dz = np.array([-.05, .05])
+        fp, fq, m = g.mtf(defocus=dz)
+        fs, ms, ft, mt = mtf_slices(fp, fq, m)
+        self.assertEqual(mt.shape, (2, 65))
+        for dzi, mti in zip(dz, mt):
+            self.s[-1].distance += dzi
+            g.rays_grid((0, .7), n=32)
+            fs1, ms1, ft1, mt1 = mtf_slices(*g.mtf())
+            self.s[-1].distance -= dzi
+            nptest.assert_allclose(np.interp(ft[:20], ft1, mt1),
+                                   mti[:20], atol=.02)
+        msf, mtf = g.mtf_fields([0, .7], ft[[5, 10]], defocus=dz,
+                                clip=False)
+        self.assertEqual(msf.shape, (2, 2, 2))
+        nptest.assert_allclose(mtf[1], mt[:, [5, 10]], rtol=1e-2)
+        nptest.assert_allclose(msf[1], ms[:, [5, 10]], atol=.02)
+        fp, fq, m = g.mtf_polychromatic((0, .7), nrays=300)
+        nptest.assert_allclose(m[0, 0], 1)
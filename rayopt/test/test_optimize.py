@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+#   rayopt - raytracing for optical imaging systems
+#   Copyright (C) 2016 Robert Jordens <jordens@phys.ethz.ch>
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import (absolute_import, print_function,
+                        unicode_literals, division)
+
+import unittest
+
+import numpy as np
+from numpy import testing as nptest
+from scipy.optimize import OptimizeResult
+
+from rayopt import (system_from_yaml, GeometricTrace, PathVariable, SpotOp,
+                    RmsSpotOp, RmsOpdOp, DistortionOp, optimize)
+from rayopt.utils import field_quadrature
+from rayopt.test.systems import cooke
+
+
+class SpotCase(unittest.TestCase):
+    def setUp(self):
+        self.s = s = system_from_yaml(cooke)
+        s.update()
+        self.v = [PathVariable(s, (j, "curvature"),
+                               (s[j].curvature - 2e-3,
+                                s[j].curvature + 2e-3))
+                  for j in (1, 2, 3, 6)]
+        self.v.append(PathVariable(s, (-1, "distance"),
+                                   (s[-1].distance - 1,
+                                    s[-1].distance + 1)))
+        self.o = [SpotOp(s, (0, y), weight=1.) for y in (0, .7, 1.)]
+
+    def test_param(self):
+        self.assertEqual(self.v[0].param, (1, "curvature"))
+        self.assertEqual(PathVariable(self.s, (1, "material", "n"),
+                                      scale=1., init=1.5).param, (1, "n"))
+        self.assertIsNone(PathVariable(self.s, (1, "radius"),
+                                       scale=1.).param)
+
+    def test_jac(self):
+        o = self.o[1]
+        o.get()
+        j = o.jac(self.v)
+        for k, v in enumerate(self.v):
+            x, h = v.get(), 1e-6
+            v.set(x + h)
+            self.s.update()
+            a = o.get()
+            v.set(x - h)
+            self.s.update()
+            b = o.get()
+            v.set(x)
+            self.s.update()
+            nptest.assert_allclose((a - b)/(2*h), j[:, k], atol=1e-5)
+        o.get()
+
+    def test_jac_stale(self):
+        def method(fun, x0, jac=None, **kwargs):
+            # cached evaluations do not retrace, jac(x0) must still be
+            # taken at x0
+            x1 = x0*(1 + 1e-2)
+            j0 = jac(x0)
+            self.assertFalse(np.allclose(jac(x1), j0))
+            fun(x0)
+            nptest.assert_allclose(jac(x0), j0)
+            return OptimizeResult(x=x0, fun=fun(x0))
+
+        optimize(self.v, self.o, method=method)
+
+    def test_jac_traces(self):
+        n = dict(get=0, update=0)
+
+        def count(f, k):
+            def g(*args):
+                n[k] += 1
+                return f(*args)
+            return g
+        self.s.update = count(self.s.update, "update")
+        for o in self.o:
+            o.get = count(o.get, "get")
+
+        def method(fun, x0, jac=None, **kwargs):
+            # one update and one trace per operand and x
+            fun(x0)
+            jac(x0)
+            self.assertEqual(n, dict(get=len(self.o), update=1))
+            x1 = x0*(1 + 1e-2)
+            jac(x1)
+            fun(x1)
+            self.assertEqual(n, dict(get=2*len(self.o), update=2))
+            return OptimizeResult(x=x0, fun=fun(x0))
+
+        optimize(self.v, self.o, method=method)
+
+    def test_optimize(self):
+        r = optimize(self.v, self.o, method="SLSQP")
+        self.assertIn("njev", r)
+        f = r.fun
+        r.reject()
+        for v in self.v:
+            v.param = None
+        r = optimize(self.v, self.o, method="SLSQP")
+        nptest.assert_allclose(r.fun, f, rtol=1e-3)
+
+
+class QuadratureCase(unittest.TestCase):
+    def setUp(self):
+        self.s = s = system_from_yaml(cooke)
+        s.update()
+
+    def test_rms(self):
+        h, w = field_quadrature(3)
+        g = GeometricTrace(self.s)
+        r, o = [], []
+        for hi in h:
+            g.rays_point((0, hi), nrays=5000, distribution="square",
+                         filter=False)
+            y = g.y[-1, 1:, :2]
+            r.append(np.sqrt(np.square(y - y.mean(0)).sum(1).mean()))
+            o.append(np.std(g.opd(resample=False)[2][1:]))
+        op = RmsSpotOp(self.s, nrays=21)
+        nptest.assert_allclose(op.get(), np.sqrt(w)*r, rtol=.01)
+        self.assertEqual(op.trace.nrays, 3*19)
+        op = RmsOpdOp(self.s, nrays=21)
+        nptest.assert_allclose(op.get(), np.sqrt(w)*o, rtol=.01)
+
+    def test_distortion(self):
+        d = DistortionOp(self.s, heights=(.5, 1.)).get()
+        g = GeometricTrace(self.s)
+        y = []
+        for hi in 1e-4, 1.:
+            g.rays_point((0, hi), nrays=1)
+            y.append(g.y[-1, 0, 1]/hi)
+        nptest.assert_allclose(d[1], y[1]/y[0] - 1, rtol=1e-3)
+        self.assertLess(abs(d[0]), abs(d[1]))
+
+    def test_optimize(self):
+        s = self.s
+        v = [PathVariable(s, (-1, "distance"),
+                          (s[-1].distance - 1, s[-1].distance + 1))]
+        o = RmsSpotOp(s, weight=1.)
+        f0 = np.square(o.get()).sum()
+        optimize(v, [o], method="SLSQP")
+        self.assertLess(np.square(o.get()).sum(), f0)
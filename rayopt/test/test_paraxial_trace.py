@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#
+#   rayopt - raytracing for optical imaging systems
+#   Copyright (C) 2013 Robert Jordens <jordens@phys.ethz.ch>
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import (absolute_import, print_function,
+                        unicode_literals, division)
+
+import unittest
+
+import numpy as np
+from numpy import testing as nptest
+
+from rayopt import system_from_yaml, ParaxialTrace, ParaxialBatch
+from rayopt.test.systems import cooke, folded
+
+
+class ParaxialBatchCase(unittest.TestCase):
+    def setUp(self):
+        self.s = system_from_yaml(cooke)
+        self.s.update()
+        self.s.paraxial.refocus()
+
+    def test_paraxial_batch(self):
+        ss = [self.s, system_from_yaml(cooke), system_from_yaml(folded)]
+        ss[1][3].curvature *= 1.1
+        ss[1][4].distance += 1
+        for s in ss[1:]:
+            s.update()
+        b = ParaxialBatch(ss)
+        self.assertEqual(b.y.shape, (3, len(self.s), 2))
+        for i, s in enumerate(ss):
+            p = ParaxialTrace(s)
+            k = np.r_[np.arange(len(s) - 1), -1]
+            for a in "y u n c".split():
+                nptest.assert_allclose(getattr(b, a)[i, k], getattr(p, a))
+            for a in ("focal_length focal_distance pupil_distance "
+                      "pupil_height numerical_aperture magnification "
+                      "f_number lagrange").split():
+                nptest.assert_allclose(getattr(b, a)[i], getattr(p, a))
+            nptest.assert_allclose(b.seidel[i], p.transverse3.sum(0))
+            nptest.assert_allclose(b.matrix[i], s.paraxial_matrix(
+                p.wavelength)[1], atol=1e-12)
@@ -28,36 +28,7 @@ from numpy import testing as nptest
 from rayopt import (system_from_yaml, ParaxialTrace, GeometricTrace,
                     system_to_yaml)
 from rayopt.utils import tanarcsin
-
-
-cooke = """
-description: 'oslo cooke triplet example 50mm f/4 20deg'
-wavelengths: [587.56e-9, 656.27e-9, 486.13e-9]
-object: {angle_deg: 20, pupil: {radius: 6.25, aim: True}}
-image: {type: finite, pupil: {radius: 0, update_radius: True}}
-elements:
-- {material: air}
-- {roc: 21.25, distance: 5.0, material: SCHOTT-SK|N-SK16, radius: 6.5}
-- {roc: -158.65, distance: 2.0, material: air, radius: 6.5}
-- {roc: -20.25, distance: 6.0, material: SCHOTT-F|N-F2, radius: 5.0}
-- {roc: 19.6, distance: 1.0, material: air, radius: 5.0}
-- {material: air, radius: 4.75}
-- {roc: 141.25, distance: 6.0, material: SCHOTT-SK|N-SK16, radius: 6.5}
-- {roc: -17.285, distance: 2.0, material: air, radius: 6.5}
-- {distance: 42.95, radius: 0.364}
-stop: 5
-pickups:
-- {get: [1, radius], set: [2, radius]}
-- {get: [3, radius], set: [4, radius]}
-- {get: [6, radius], set: [7, radius]}
-validators:
-- {get: [edge_y, 2], minimum: .5}
-- {get: [2, distance], minimum: .5}
-- {get: [edge_y, 4], minimum: .5}
-- {get: [4, distance], minimum: .5}
-- {get: [edge_y, 7], minimum: .5}
-- {get: [7, distance], minimum: .5}
-"""
+from rayopt.test.systems import cooke
 
 
 class DemotripCase(unittest.TestCase):
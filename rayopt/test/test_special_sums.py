@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#
+#   rayopt - raytracing for optical imaging systems
+#   Copyright (C) 2016 Robert Jordens <jordens@phys.ethz.ch>
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import (absolute_import, print_function,
+                        unicode_literals, division)
+
+import unittest
+
+import numpy as np
+from numpy import testing as nptest
+
+from rayopt.special_sums import polar_sum, polar_binning, PolarBinning
+
+
+class BinningCase(unittest.TestCase):
+    def setUp(self):
+        self.m = np.random.RandomState(0).rand(3, 17, 23)
+
+    def test_polar_sum(self):
+        m = np.arange(1., 10.).reshape((3, 3))
+        nptest.assert_equal(polar_sum(m, (1, 1), "azimuthal", binsize=1.),
+                            [5, 40])
+        nptest.assert_equal(
+            polar_sum(m, (1, 1), "radial", binsize=np.pi/4),
+            [4, 1, 2, 3, 11, 9, 8, 7])
+
+    def test_cached(self):
+        b = polar_binning((17, 23), (8., 11.5))
+        self.assertIs(b, polar_binning((17, 23), (8., 11.5)))
+        self.assertIsNot(b, polar_binning((17, 23), (8., 11.)))
+
+    def test_batch(self):
+        for direction in "azimuthal", "radial", "square":
+            b = PolarBinning((17, 23), (8.3, 11.7), direction)
+            r = b.sum(self.m)
+            self.assertEqual(r.shape, (3, b.counts.size))
+            for mi, ri in zip(self.m, r):
+                nptest.assert_allclose(
+                    ri, polar_sum(mi, (8.3, 11.7), direction))
+            nptest.assert_allclose(r.sum(1), self.m.sum((1, 2)))
+            nptest.assert_allclose(b.mean(np.ones((17, 23))),
+                                   np.where(b.counts, 1, np.nan))
+
+    def test_energy(self):
+        b = PolarBinning((17, 23), (8, 11), "square")
+        e = b.cumsum(self.m)
+        nptest.assert_allclose(e[:, 3], self.m[:, 5:12, 8:15].sum((1, 2)))
+        b = PolarBinning((17, 23), (8, 11), binsize=2.)
+        e = b.cumsum(self.m)
+        i, j = np.ogrid[:17, :23]
+        r = np.hypot(i - 8, j - 11) < 6
+        nptest.assert_allclose(e[:, 2], (self.m*r).sum((1, 2)))
+        nptest.assert_allclose(b.edges[:3], [0, 2, 4])
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+#
+#   rayopt - raytracing for optical imaging systems
+#   Copyright (C) 2013 Robert Jordens <jordens@phys.ethz.ch>
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import (absolute_import, print_function,
+                        unicode_literals, division)
+
+import unittest
+
+import numpy as np
+from numpy import testing as nptest
+
+from rayopt import system_from_yaml, ParaxialTrace, GeometricTrace
+from rayopt.test.systems import cooke, folded
+
+
+class SystemCase(unittest.TestCase):
+    def setUp(self):
+        self.s = system_from_yaml(cooke)
+        self.s.update()
+        self.s.paraxial.refocus()
+
+    def test_index_table(self):
+        l = self.s.wavelengths
+        n = self.s.refractive_indices()
+        self.assertEqual(n.shape, (len(self.s), len(l)))
+        for j in range(len(self.s)):
+            nptest.assert_allclose(
+                n[j], [self.s.refractive_index(li, j) for li in l])
+        self.assertIs(self.s.refractive_indices(), n)
+        m = self.s[1].material
+        nptest.assert_allclose(m.refractive_indices(np.array(l)[:, None]),
+                               n[1][:, None])
+        self.s[1].material = self.s[3].material
+        nptest.assert_allclose(self.s.refractive_indices()[1], n[3])
+
+    def test_geometry(self):
+        s = system_from_yaml(folded)
+        s.update()
+        g = s.geometry()
+        self.assertIs(s.geometry(), g)
+        nptest.assert_allclose(g.origins, np.cumsum(
+            [e.offset for e in s], axis=0))
+        nptest.assert_allclose(g.mirrored, [1, -1, 1, 1])
+        self.assertTrue(g.transferred[2] and g.transferred[3])
+        y = np.random.RandomState(0).randn(5, 3)
+        for j in range(1, len(s)):
+            a = s[j].to_normal(s[j - 1].from_normal(y) - s[j].offset)
+            nptest.assert_allclose(np.dot(y, g.transfers[j]) +
+                                   g.shifts[j], a, atol=1e-12)
+        t = GeometricTrace(s)
+        t.rays_point((0, .5), nrays=30, distribution="square")
+        y, u = s[0].from_normal(t.y[0], t.u[0])
+        n = t.n[0]
+        for j in range(1, len(s)):
+            y, i = s[j].to_normal(y - s[j].offset, u)
+            y, u, n, _ = s[j].propagate(y, i, n, t.l)
+            nptest.assert_allclose(t.y[j], y, atol=1e-9)
+            nptest.assert_allclose(t.i[j], i, atol=1e-12)
+            nptest.assert_allclose(t.u[j], u, atol=1e-12)
+            y, u = s[j].from_normal(y, u)
+        s[1].distance += 1
+        self.assertIsNot(s.geometry(), g)
+        nptest.assert_allclose(s.path[1:], g.path[1:] + 1)
+
+    def test_paraxial_products(self):
+        l = self.s.wavelengths[0]
+
+        def product(start, stop):
+            n, m = 1., np.eye(4)
+            for n, mi in self.s.paraxial_matrices(l, start, stop):
+                m = np.dot(mi, m)
+            return n, m
+
+        p = self.s.paraxial_products(l)
+        self.s[3].curvature *= 1.1
+        self.assertIs(self.s.paraxial_products(l), p)
+        for a, b in [(1, 4), (4, None), (2, 5), (3, 4), (5, 5), (1, None)]:
+            n0, m0 = product(a, b)
+            n, m = self.s.paraxial_matrix(l, a, b)
+            nptest.assert_allclose(n, n0)
+            nptest.assert_allclose(m, m0, atol=1e-12)
+
+    def test_propagate_paraxial_index(self):
+        l = self.s.wavelengths[0]
+        yu = np.array([1., 0, .1, 0])
+        n = self.s.paraxial_products(l).n
+        # the system's indices (cached products) and others
+        for start, n0 in (1, n[0]), (3, n[2]), (1, 1.3), (3, 1.5):
+            a = list(self.s.propagate_paraxial(yu, n0, l, start))
+            b, ybu, n = [], yu, n0
+            for e in self.s[start:]:
+                ybu, n = e.propagate_paraxial(ybu, n, l)
+                b.append((ybu, n))
+            self.assertEqual(len(a), len(b))
+            for (ya, na), (yb, nb) in zip(a, b):
+                nptest.assert_allclose(ya, yb, atol=1e-12)
+                nptest.assert_allclose(na, nb)
+
+    def test_incremental(self):
+        p = ParaxialTrace(self.s)
+        p.update_conjugates()
+        g = GeometricTrace(self.s)
+        p.update()
+        g.rays_point((0, .7), nrays=20, distribution="square", clip=True)
+        st = self.s.stamps()
+        self.s.update()
+        self.assertIsNone(self.s.first_change(st))
+        self.s.set_path((6, "curvature"), self.s[6].curvature*1.01)
+        self.assertEqual(self.s.first_change(st), 6)
+        p.update()
+        g.update()
+        p1 = ParaxialTrace(self.s)
+        p1.update_conjugates()
+        g1 = GeometricTrace(self.s)
+        p1.update(full=True)
+        g1.rays_point((0, .7), nrays=20, distribution="square", clip=True)
+        nptest.assert_allclose(p.y, p1.y)
+        nptest.assert_allclose(p.c, p1.c)
+        nptest.assert_allclose(g.y, g1.y)
+        nptest.assert_allclose(g.t, g1.t)
+        self.s[6].material.touch()
+        self.assertEqual(self.s.first_change(st), 1)
+
+
+class AimCase(unittest.TestCase):
+    def setUp(self):
+        self.s = system_from_yaml(cooke)
+        self.s.update()
+        self.s.paraxial.refocus()
+
+    def test_pupils(self):
+        yo = np.c_[np.zeros(5), np.linspace(0, 1, 5)]
+        z, a = self.s.pupils(yo)
+        self.s._pupil_cache.clear()
+        for yi, zi, ai in zip(yo, z, a):
+            zj, aj = self.s.pupil(yi)
+            # pupil() starts from the cached neighbours, pupils() cold
+            nptest.assert_allclose(zi, zj, rtol=1e-9)
+            nptest.assert_allclose(ai, aj, rtol=1e-8)
+
+    def test_pupil_cache(self):
+        self.s.update()
+        f = self.s.fingerprint()
+        z, a = self.s.pupil((0, .7))
+        self.s.update()
+        self.assertEqual(self.s.fingerprint(), f)
+        c, = self.s._pupil_cache.values()
+        self.assertIn((0, .7), c.cache)
+        self.s[1].curvature += 1e-6
+        self.assertNotEqual(self.s.fingerprint(), f)
+        # stale before (and during) update()
+        self.s.pupil((0, .7))
+        self.assertEqual(c.key, self.s.fingerprint())
+        self.s.update()
+        z1, a1 = self.s.pupil((0, .7))
+        self.assertEqual(c.key, self.s.fingerprint())
+        self.s._pupil_cache.clear()
+        z2, a2 = self.s.pupil((0, .7))
+        nptest.assert_allclose(z1, z2, rtol=1e-9)
+        nptest.assert_allclose(a1, a2, rtol=1e-8)
+
+    def test_pupil_warm(self):
+        def scale_pupil(s):
+            s.object.pupil.radius *= 1.5
+
+        def move_stop(s):
+            s.stop = 4
+        yo = np.c_[np.zeros(3), np.linspace(0, 1, 3)]
+        for change in scale_pupil, move_stop:
+            s = system_from_yaml(cooke)
+            s.update()
+            s.pupil((0, .7))
+            s.pupils(yo)
+            f = s.fingerprint()
+            change(s)
+            s.update()
+            self.assertNotEqual(s.fingerprint(), f)
+            z1, a1 = s.pupil((0, .7))
+            z2, a2 = s.pupils(yo)
+            s._pupil_cache.clear()
+            nptest.assert_allclose(s.pupil((0, .7))[0], z1, rtol=1e-9)
+            nptest.assert_allclose(s.pupil((0, .7))[1], a1, rtol=1e-8)
+            s._pupil_cache.clear()
+            z3, a3 = s.pupils(yo)
+            nptest.assert_allclose(z3, z2, rtol=1e-9)
+            nptest.assert_allclose(a3, a2, rtol=1e-8)
+
+    def test_solve_nan(self):
+        def merit(a):
+            return np.where(a > .5, np.nan, a - 1)
+        self.assertRaises(ValueError, self.s.solve_secant, merit,
+                          np.zeros(2))
+
+        def merit(a):
+            return np.where(np.fabs(a - .7) < .05, np.nan, a - .7)
+        self.assertRaises(ValueError, self.s.solve_bracket, merit,
+                          np.ones(2))
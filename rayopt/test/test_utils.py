@@ -75,3 +75,20 @@ class MiscCase(unittest.TestCase):
                                [0, .596, .919], atol=1e-3)
         nptest.assert_allclose(np.unique(w),
                                [.111, .188/3*2, .256/3*2], atol=1e-3)
+
+    def test_quadrature(self):
+        self.assertIs(gr_roots(5)[0], gr_roots(5)[0])
+        for k in "radau", "lobatto", "gauss":
+            i, xy, w = disk_quadrature(k, 21)
+            self.assertIs(xy, disk_quadrature(k, 21)[1])
+            self.assertFalse(xy.flags.writeable)
+            nptest.assert_allclose(xy[i], 0)
+            nptest.assert_allclose(w.sum(), 1)
+            self.assertTrue(np.all(xy[:, 0] >= -1e-15))
+            r2 = np.square(xy).sum(1)
+            # mean of r**2k over the disk is 1/(k + 1)
+            for j in range(4):
+                nptest.assert_allclose(np.dot(w, r2**j), 1/(j + 1))
+        self.assertEqual(disk_quadrature("gauss", 21)[1].shape, (19, 2))
+        h, w = field_quadrature(3)
+        nptest.assert_allclose(np.dot(w, h**4), 1/3)
@@ -21,6 +21,8 @@ from __future__ import (absolute_import, print_function,
 
 import unittest
 
+from numpy import testing as nptest
+
 from rayopt import (system_from_yaml, system_to_yaml, system_to_json,
                     system_from_json)
 
@@ -56,3 +58,13 @@ elements:
         d = system_to_json(self.s)
         s = system_from_json(d)
         s
+
+    def test_spectral_weights(self):
+        self.s.set_band(450e-9, 650e-9, 11, lambda l: l/550e-9)
+        nptest.assert_allclose(self.s.wavelengths[0], 550e-9)
+        s = system_from_yaml(system_to_yaml(self.s))
+        nptest.assert_allclose(s.spectral_weights,
+                               self.s.spectral_weights)
+        l, w = s.spectrum()
+        nptest.assert_allclose(w.sum(), 1)
+        nptest.assert_allclose(w*550e-9/l, w[0])
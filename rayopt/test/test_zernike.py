@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+#
+#   rayopt - raytracing for optical imaging systems
+#   Copyright (C) 2016 Robert Jordens <jordens@phys.ethz.ch>
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import (absolute_import, print_function,
+                        unicode_literals, division)
+
+import unittest
+
+import numpy as np
+from numpy import testing as nptest
+
+from rayopt import (system_from_yaml, GeometricTrace, noll_to_nm,
+                    zernike_basis, zernike_fit, ZernikeFit)
+from rayopt.utils import pupil_distribution
+from rayopt.test.systems import cooke
+
+
+class ZernikeCase(unittest.TestCase):
+    def test_noll(self):
+        nm = [noll_to_nm(j) for j in range(1, 12)]
+        self.assertEqual(nm, [(0, 0), (1, 1), (1, -1), (2, 0), (2, -2),
+                              (2, 2), (3, -1), (3, 1), (3, -3), (3, 3),
+                              (4, 0)])
+        self.assertRaises(ValueError, noll_to_nm, 0)
+
+    def test_orthonormal(self):
+        ref, xy, w = pupil_distribution("square", 20000)
+        b = zernike_basis(xy[1:, 0], xy[1:, 1], 15)
+        nptest.assert_allclose(np.dot(b.T, b)/b.shape[0], np.eye(15),
+                               atol=.03)
+
+    def test_fit(self):
+        c = np.random.RandomState(0).randn(4, 15)
+        for d, n in ("square", 300), ("radau", 100):
+            z = zernike_fit(d, n)
+            self.assertIs(z, zernike_fit(d, n))
+            if d == "radau":
+                # only x symmetric terms are determined
+                c[:, [1, 4, 7, 9, 12, 14]] = 0
+            o = z.evaluate(c)
+            nptest.assert_allclose(z.fit(o), c, atol=1e-9)
+            nptest.assert_allclose(z.residual(o), 0, atol=1e-9)
+
+    def test_trace(self):
+        s = system_from_yaml(cooke)
+        s.update()
+        g = GeometricTrace(s)
+        r = []
+        for d, n in ("square", 500), ("radau", 100):
+            g.rays_point((0, .7), nrays=n, distribution=d)
+            c, e = g.zernike()
+            r.append(c)
+            self.assertLess(e, .1)
+        g.rays_grid((0, .7), n=24)
+        r.append(g.zernike()[0])
+        nptest.assert_allclose(r[1], r[0], atol=.01)
+        nptest.assert_allclose(r[2], r[0], atol=.01)
+        # no x odd terms for a meridional field
+        nptest.assert_allclose(r[0][[1, 4, 7, 9, 12, 14]], 0, atol=1e-9)
+        g.rays_point((0, 0), nrays=500, distribution="square")
+        c, e = g.zernike()
+        x, y, o = g.opd(resample=False)
+        z = ZernikeFit(g.pupil_points[1:], 15)
+        nptest.assert_allclose(c, z.fit(o[1:]))
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+#   rayopt - raytracing for optical imaging systems
+#   Copyright (C) 2016 Robert Jordens <jordens@phys.ethz.ch>
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#cython: boundscheck=False, wraparound=False, cdivision=True,
+#cython: embedsignature=True, initializedcheck=False
+
+from __future__ import (absolute_import, print_function,
+                        unicode_literals, division)
+
+import cython
+import numpy as np
+cimport numpy as np
+from libc.math cimport sqrt, fabs, isfinite, NAN
+
+np.import_array()
+
+
+cdef inline void spheroid_sag_normal(double x, double y, double z,
+                                     double c, double k,
+                                     const double[::1] a,
+                                     double *f, double *e) nogil:
+    """Sag `f` at (x, y, z) and the transverse normal factor `e`:
+    the surface normal is (x*e, y*e, 1)"""
+    cdef int i
+    cdef double r2 = x*x + y*y, w, d = 0., dp = 0.
+    f[0] = z
+    e[0] = 0.
+    if c != 0.:
+        w = sqrt(1 - (1 + k)*c*c*r2)
+        f[0] -= c*r2/(1 + w)
+        e[0] -= c/w
+    for i in range(a.shape[0] - 1, -1, -1):
+        d += a[i]
+        d *= r2
+        dp *= r2
+        dp += 2*(i + 1)*a[i]
+    f[0] -= d
+    e[0] -= dp
+
+
+cpdef void spheroid_propagate(double[:, ::1] y, double[:, ::1] u,
+                              double[::1] t, const double[:] n0,
+                              const double[:] mu, double c, double k,
+                              const double[::1] a, bint alternate,
+                              double radius, bint clip,
+                              double tol=1e-7, int maxiter=5):
+    """Propagate rays given in the normal coordinates of a spheroid
+    (curvature `c`, conic `k` and even aspheric coefficients `a`) to the
+    surface, clip them at `radius`, and refract (or reflect if `mu` is
+    -1) them with the index ratio `mu`. `y` and `u` are updated in place
+    and `t` receives the optical path length in the medium of index `n0`.
+    Uses the analytic conic intercept and for aspheres refines it with
+    Newton-Raphson, steps bounded by `radius` (non-converged rays are
+    nan)."""
+    cdef int i, j, m = y.shape[0]
+    cdef double y0, y1, y2, u0, u1, u2, s, d, e, f, g, p0, p1, p2
+    cdef double q0, q1, q2, qq, muf, b, mui
+    cdef double kk = 1 + k, r2max = radius*radius
+    with nogil:
+        for i in range(m):
+            y0, y1, y2 = y[i, 0], y[i, 1], y[i, 2]
+            u0, u1, u2 = u[i, 0], u[i, 1], u[i, 2]
+            # intercept
+            s = -y2/u2
+            if c != 0.:
+                d = c*(u0*y0 + u1*y1 + kk*u2*y2) - u2
+                e = c*(u0*u0 + u1*u1 + kk*u2*u2)
+                f = c*(y0*y0 + y1*y1 + kk*y2*y2) - 2*y2
+                g = sqrt(d*d - e*f)
+                if alternate:
+                    g = -g
+                # -(d + g)/e without cancellation
+                if d*g < 0:
+                    d = f/(g - d)
+                else:
+                    d = -(d + g)/e
+                if isfinite(d) or a.shape[0] == 0:
+                    s = d
+            if a.shape[0] != 0:
+                if not isfinite(s):
+                    s = NAN
+                for j in range(maxiter + 1):
+                    if j == maxiter:
+                        s = NAN
+                        break
+                    p0, p1, p2 = y0 + s*u0, y1 + s*u1, y2 + s*u2
+                    spheroid_sag_normal(p0, p1, p2, c, k, a, &f, &e)
+                    if f == 0.:
+                        break
+                    d = f/((p0*u0 + p1*u1)*e + u2)
+                    if not isfinite(d):
+                        s = NAN
+                        break
+                    if d > radius:
+                        d = radius
+                    elif d < -radius:
+                        d = -radius
+                    s -= d
+                    if fabs(d) < tol:
+                        break
+            y0 += s*u0
+            y1 += s*u1
+            y2 += s*u2
+            y[i, 0], y[i, 1], y[i, 2] = y0, y1, y2
+            t[i] = s*n0[i]
+            if clip and not (y0*y0 + y1*y1 <= r2max):
+                u[i, 0] = u[i, 1] = u[i, 2] = NAN
+                continue
+            # refraction, Spencer and Murty
+            mui = mu[i]
+            if mui == 1.:
+                continue
+            if c == 0. and a.shape[0] == 0:
+                q0 = q1 = 0.
+            else:
+                spheroid_sag_normal(y0, y1, y2, c, k, a, &f, &e)
+                q0, q1 = y0*e, y1*e
+            q2 = 1.
+            qq = q0*q0 + q1*q1 + q2*q2
+            muf = fabs(mui)
+            d = muf*(u0*q0 + u1*q1 + u2*q2)/qq
+            if mui == -1.:
+                g = -2*d
+            else:
+                b = (mui*mui - 1)/qq
+                g = sqrt(d*d - b)
+                if mui < 0:
+                    g = -g
+                g -= d
+            u[i, 0] = muf*u0 + g*q0
+            u[i, 1] = muf*u1 + g*q1
+            u[i, 2] = muf*u2 + g*q2
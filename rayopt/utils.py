@@ -23,6 +23,7 @@ import sys
 
 import numpy as np
 from scipy.special import orthogonal
+from fastcache import clru_cache
 
 
 def public(f):
@@ -133,6 +134,8 @@ def pupil_distribution(distribution, nrays):
     square: regular square grid
     triangular: regular triangular grid
     hexapolar: regular hexapolar grid
+    radau, lobatto, gauss: quadrature rules over the x >= 0 half
+        of the aperture, see disk_quadrature()
     """
     d = distribution
     n = nrays
@@ -187,42 +190,98 @@ def pupil_distribution(distribution, nrays):
             a = np.linspace(0, 2*np.pi, 6*i, endpoint=False)
             l.append([np.sin(a)*i/n, np.cos(a)*i/n])
         xy = np.concatenate(l, axis=1).T
-    elif d == "radau":
-        n = int(np.sqrt(n) + 1)
-        x, w = gr_roots(n)
-        r, p, weight = interval_to_circle(x, w)
-        xy = np.c_[r*np.cos(p), r*np.sin(p)]
-    elif d == "lobatto":
-        n = int(np.sqrt(n) + 1)
-        x, w = gl_roots(n)
-        r, p, weight = interval_to_circle(x, w)
-        xy = np.c_[r*np.cos(p), r*np.sin(p)]
+    elif d in ("radau", "lobatto", "gauss"):
+        ref, xy, weight = disk_quadrature(d, n)
+        xy, weight = xy.copy(), weight.copy()
     else:
         raise ValueError("unknown ray distribution", d)
     return ref, xy, weight
 
 
 @public
+def pupil_chunks(distribution, nrays, chunk=4096):
+    """Yields chunks (xy, weight) of at most `chunk` rays of
+    `pupil_distribution(distribution, nrays)`. Random distributions
+    are generated chunk by chunk.
+    """
+    if distribution == "random":
+        while nrays > 0:
+            n = min(nrays, chunk)
+            r, phi = np.random.rand(2, n)
+            xy = np.exp(2j*np.pi*phi)*np.sqrt(r)
+            yield np.c_[xy.real, xy.imag], np.ones(n)
+            nrays -= n
+        return
+    ref, xy, weight = pupil_distribution(distribution, nrays)
+    if weight is None or len(weight) != len(xy):
+        weight = np.ones(len(xy))
+    for i in range(0, len(xy), chunk):
+        yield xy[i:i + chunk], weight[i:i + chunk]
+
+
+def _readonly(*a):
+    for ai in a:
+        ai.setflags(write=False)
+    return a
+
+
+@public
+@clru_cache(maxsize=64)
 def gl_roots(n):
     """Gauss Lobatto roots and weights for [-1, 1]
-    with -1 first and 1 last
+    with -1 first and 1 last (cached, read-only)
     """
     leg = orthogonal.legendre(n - 1)
     x = np.r_[-1, leg.deriv().roots, 1]
     w = 2/(n*(n - 1)*leg(x)**2)
-    return x, w
+    return _readonly(x, w)
 
 
 @public
+@clru_cache(maxsize=64)
 def gr_roots(n):
     """Gauss Radau roots and weights for [-1, 1]
-    with -1 first
+    with -1 first (cached, read-only)
     """
     leg = orthogonal.legendre(n - 1)
     l = (leg + orthogonal.legendre(n))/np.poly1d((1, 1))
     x = np.r_[-1, l[0].roots]
     w = (1 - x)/(n * leg(x))**2
-    return x, w
+    return _readonly(x, w)
+
+
+@public
+@clru_cache(maxsize=64)
+def disk_quadrature(kind, nrays):
+    """Quadrature rule of about `nrays` points over the x >= 0 half
+    of the unit disk (for systems symmetric in x) with the Gauss
+    Radau, Lobatto or Legendre (`kind` "radau", "lobatto" or "gauss")
+    roots in r**2 and equally spaced angles.
+
+    Returns the center ray index, the points and the weights (cached,
+    read-only). The "gauss" rule has no point at the center, the
+    chief ray is prepended with zero weight.
+    """
+    if kind == "gauss":
+        n = max(1, int(np.sqrt(nrays/2)))
+        x, w = np.polynomial.legendre.leggauss(n)
+        r, p, w = interval_to_circle(x, w, 2*n)
+        r, p, w = np.r_[0, r], np.r_[0, p], np.r_[0, w]
+    else:
+        n = int(np.sqrt(nrays) + 1)
+        x, w = {"radau": gr_roots, "lobatto": gl_roots}[kind](n)
+        r, p, w = interval_to_circle(x, w)
+    xy = np.c_[r*np.cos(p), r*np.sin(p)]
+    return (0,) + _readonly(xy, w)
+
+
+@public
+@clru_cache(maxsize=64)
+def field_quadrature(n):
+    """Gauss Legendre rule of `n` normalized field heights over a
+    circular field: heights and weights (cached, read-only)"""
+    x, w = np.polynomial.legendre.leggauss(n)
+    return _readonly(np.sqrt((x + 1)/2), w/2)
 
 
 @public
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+#   rayopt - raytracing for optical imaging systems
+#   Copyright (C) 2016 Robert Jordens <jordens@phys.ethz.ch>
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Zernike polynomials on the unit disk in Noll ordering and
+normalization (unit RMS over the disk), and their least squares fits to
+wavefronts sampled at pupil points."""
+
+from __future__ import (absolute_import, print_function,
+                        unicode_literals, division)
+
+from math import factorial
+
+import numpy as np
+from fastcache import clru_cache
+
+from .utils import public, pupil_distribution
+
+
+# pupil distributions that only sample the x >= 0 half
+half_distributions = "radau", "lobatto", "gauss"
+# pupil distributions with an extra chief ray prepended
+chief_distributions = "square", "triangular", "random"
+
+
+@public
+def noll_to_nm(j):
+    """Radial order n and signed azimuthal order m of the Noll index
+    `j` (>= 1). m > 0 are cosine terms, m < 0 sine terms."""
+    if j < 1:
+        raise ValueError("Noll indices start at 1")
+    n = int((-1 + np.sqrt(8*j - 7))/2)
+    p = j - n*(n + 1)//2 - 1
+    m = n % 2 + 2*((p + (n + 1) % 2)//2)
+    if m and j % 2:
+        m = -m
+    return n, m
+
+
+def zernike_radial(n, m, r):
+    """Radial polynomial R_n^|m|(r)"""
+    m = abs(m)
+    v = np.zeros_like(r)
+    for s in range((n - m)//2 + 1):
+        c = (-1)**s*factorial(n - s)/(
+            factorial(s)*factorial((n + m)//2 - s)*
+            factorial((n - m)//2 - s))
+        v = v + c*r**(n - 2*s)
+    return v
+
+
+@public
+def zernike(j, x, y):
+    """Zernike polynomial of Noll index `j` at the normalized pupil
+    coordinates `x`, `y`"""
+    n, m = noll_to_nm(j)
+    x, y = np.asarray(x, np.float64), np.asarray(y, np.float64)
+    r = np.hypot(x, y)
+    v = zernike_radial(n, m, r)
+    if m == 0:
+        return np.sqrt(n + 1)*v
+    t = np.arctan2(y, x)
+    if m > 0:
+        return np.sqrt(2*(n + 1))*v*np.cos(m*t)
+    return np.sqrt(2*(n + 1))*v*np.sin(-m*t)
+
+
+@public
+def zernike_basis(x, y, nterms):
+    """The first `nterms` Zernike polynomials at `x`, `y`, shape
+    (len(x), nterms)"""
+    return np.array([zernike(j, x, y) for j in range(1, nterms + 1)]).T
+
+
+@public
+class ZernikeFit(object):
+    """Weighted least squares fit of the first `nterms` Zernike
+    polynomials to wavefronts sampled at the normalized pupil points
+    `xy` with weights `w`.
+
+    If `mirror` is set, the points only sample the x >= 0 half of the
+    pupil (as the radau and lobatto distributions) and the wavefronts
+    are taken to be symmetric in x.
+
+    The basis and its pseudo-inverse are computed once, each `fit()` is
+    a matrix product.
+    """
+    def __init__(self, xy, nterms=15, w=None, mirror=False):
+        xy = np.asarray(xy, np.float64)
+        if w is None:
+            w = np.ones(xy.shape[0])
+        self.xy = xy
+        self.nterms = nterms
+        self.w = w = w/w.sum()
+        self.basis = zernike_basis(xy[:, 0], xy[:, 1], nterms)
+        if mirror:
+            w = np.r_[w, w]/2
+            b = np.r_[self.basis, zernike_basis(-xy[:, 0], xy[:, 1],
+                                                nterms)]
+        else:
+            b = self.basis
+        ws = np.sqrt(w)
+        self.inverse = np.linalg.pinv(b*ws[:, None])*ws
+        if mirror:
+            n = xy.shape[0]
+            self.inverse = self.inverse[:, :n] + self.inverse[:, n:]
+        for a in self.xy, self.w, self.basis, self.inverse:
+            a.setflags(write=False)
+
+    def fit(self, o):
+        """Zernike coefficients of the wavefronts `o` (..., len(xy)),
+        shape (..., nterms)"""
+        return np.dot(o, self.inverse.T)
+
+    def evaluate(self, c):
+        """Wavefronts at the pupil points from the coefficients `c`"""
+        return np.dot(c, self.basis.T)
+
+    def residual(self, o, c=None):
+        """Weighted RMS of the fit residual of `o`"""
+        if c is None:
+            c = self.fit(o)
+        r = o - self.evaluate(c)
+        return np.sqrt(np.dot(np.square(r), self.w))
+
+
+@public
+@clru_cache(maxsize=128)
+def zernike_fit(distribution, nrays, nterms=15):
+    """Cached `ZernikeFit` for the pupil points of
+    `pupil_distribution(distribution, nrays)`. The extra chief ray of the
+    grid distributions gets zero weight."""
+    if distribution == "random":
+        raise ValueError("random distributions can not be cached")
+    ref, xy, w = pupil_distribution(distribution, nrays)
+    if w is None or len(w) != len(xy):
+        w = np.ones(len(xy))
+        if distribution in chief_distributions:
+            w[0] = 0
+    mirror = distribution in half_distributions
+    return ZernikeFit(xy, nterms, w, mirror)
@@ -56,6 +56,8 @@ setup(
                   sources=["rayopt/_transformations.c"]),
         Extension("rayopt.simplex_accel",
                   sources=["rayopt/simplex_accel.pyx"]),
+        Extension("rayopt.trace_accel",
+                  sources=["rayopt/trace_accel.pyx"]),
     ]),
     include_dirs=[np.get_include()],
     entry_points={},